@@ -1,8 +1,9 @@
 # -*- mode: python ; coding: utf-8 -*-
 
 
+# Exécutable console : mode batch (batch_report.py), le tableau de bord se lance avec `streamlit run FREQUENCY.py`
 a = Analysis(
-    ['FREQUENCY.py'],
+    ['batch_report.py'],
     pathex=[],
     binaries=[],
     datas=[],
@@ -10,7 +11,7 @@ a = Analysis(
     hookspath=[],
     hooksconfig={},
     runtime_hooks=[],
-    excludes=[],
+    excludes=['streamlit', 'folium', 'branca', 'plotly', 'streamlit_folium', 'altair', 'matplotlib'],
     noarchive=False,
     optimize=0,
 )
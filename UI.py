@@ -1,3 +1,316 @@
+import hashlib
+import json
+import math
+from datetime import date
+from uuid import uuid4
+
+import pandas as pd
 import streamlit as st
+from aggregations import chart_data
+from exports import EXPORT_FORMATS, export_bytes
+from frequency import COLOR, LAST_VISIT, SALES, window_column, with_recency
+from ingestion import load_outlet_ids, load_recency
+from metrics import current_profile, run_seconds, stage
+from materialize import LAT, LON, pdv_view, with_coordinates
+from prefetch import PREFETCH_NEIGHBOURS, schedule
+from route_planner import plan_route, route_gpx, route_table
+from spatial_index import circle_feature, load_spatial_index
+from sql_store import count_lines, query_lines
+from stage_cache import cached, frame_key
+from search_index import ALL_TEXT_COLUMNS, SEARCH_MODES
+
+
 def UI():
-    st.markdown("""<h3 style="color:#002B50;">⚛  BUSINESS ANALYTICS DASHBOARD</h3>""", unsafe_allow_html=True)
\ No newline at end of file
+    st.markdown("""<h3 style="color:#002B50;">⚛  BUSINESS ANALYTICS DASHBOARD</h3>""", unsafe_allow_html=True)
+
+
+# Bouton de téléchargement : le fichier n'est construit qu'à la demande, dans le format choisi,
+# puis réutilisé tant que la sélection (données, filtres, colonnes) et le format ne changent pas
+def export_download(df, key, file_stem="données_filtrées", version=None):
+    fmt = st.selectbox("Export format", list(EXPORT_FORMATS), key=f"{key}_format")
+    extension, mime, _ = EXPORT_FORMATS[fmt]
+    ready_key = f"{key}_ready"
+    current = (frame_key(df, version), fmt)
+    if st.session_state.get(ready_key) != current:
+        if not st.button(f"⚙️ Prepare {fmt} export", key=f"{key}_prepare"):
+            return
+        st.session_state[ready_key] = current
+    with stage("export") as record:
+        data = export_bytes(df, fmt, version)
+        record["rows"] = len(df)
+    st.download_button(
+        label=f"📥 Download filtered data in {fmt} format",
+        data=data,
+        file_name=f"{file_stem}.{extension}",
+        mime=mime,
+        key=key
+    )
+
+
+# Explorateur de DataFrame : recherche dans l'index précalculé (contient / commence par / égal à)
+# case=True ignore la casse par défaut
+def dataframe_explorer(df, search_index, case=True):
+    filter_column = st.selectbox("Filter dataframe on", [ALL_TEXT_COLUMNS] + list(df.columns))
+    col1, col2 = st.columns(2)
+    mode = col1.selectbox("Type de recherche", list(SEARCH_MODES))
+    ignore_case = col2.checkbox("Ignorer la casse", value=case)
+    filter_value = st.text_input("Valeur de filtre")
+    if filter_value:
+        # Le masque couvre toute la vue : il s'applique à la sélection par ses étiquettes de ligne
+        mask = search_index.search(filter_value, filter_column, SEARCH_MODES[mode], ignore_case)
+        filtered_df = df[mask[df.index]]
+    else:
+        filtered_df = df  # Aucune filtration si aucune valeur de filtre n'est donnée
+    return filtered_df
+
+
+# Ordre de tri (positions) d'une colonne, calculé une fois par sélection, colonne et sens. Les tableaux réindexés
+# (points de vente sans visite, tournée) ont tous le même index : content_key=True fait porter la clé sur les valeurs
+# de la colonne, hachées à chaque relance, au lieu de frame_key.
+def sort_order(df, column, descending=False, content_key=False, version=None):
+    def compute():
+        values = df[column].reset_index(drop=True)
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            # Catégories dans l'ordre d'apparition : tri alphabétique comme pour le texte
+            values = values.cat.reorder_categories(sorted(values.cat.categories, key=str))
+        return values.sort_values(ascending=not descending, kind="stable", na_position="last").index.to_numpy()
+    if content_key:
+        digest = hashlib.sha1(pd.util.hash_pandas_object(df[column], index=False).to_numpy().tobytes()).hexdigest()
+    else:
+        digest = frame_key(df, version)
+    return cached("sort_order", (digest, column, descending), compute)
+
+
+# Contrôles d'un tableau paginé : colonnes affichées, tri, taille et numéro de page
+def page_controls(key, all_columns, total, columns=None, page_sizes=(25, 50, 100, 500)):
+    all_columns = list(all_columns)
+    shown = st.multiselect("Columns", all_columns, default=[c for c in dict.fromkeys(columns or all_columns) if c in all_columns],
+                           key=f"{key}_columns")
+    col1, col2, col3, col4 = st.columns(4)
+    sort_by = col1.selectbox("Sort by", ["(none)"] + all_columns, key=f"{key}_sort")
+    descending = col2.checkbox("Descending", key=f"{key}_descending")
+    page_size = col3.selectbox("Rows per page", page_sizes, key=f"{key}_page_size")
+    pages = max(1, math.ceil(total / page_size))
+    page = col4.number_input(f"Page (1-{pages})", min_value=1, max_value=pages, value=1, key=f"{key}_page")
+    start = (min(page, pages) - 1) * page_size
+    return shown, None if sort_by == "(none)" else sort_by, descending, start, page_size
+
+
+# Tableau paginé : tri, projection et découpage faits côté serveur sur la sélection partagée,
+# seule la page visible (colonnes choisies) est envoyée au navigateur
+def paged_table(df, key, columns=None, page_sizes=(25, 50, 100, 500), content_key=False, version=None):
+    shown, sort_by, descending, start, page_size = page_controls(key, df.columns, len(df), columns, page_sizes)
+    if sort_by is None:
+        rows = df.iloc[start:start + page_size]
+    else:
+        rows = df.iloc[sort_order(df, sort_by, descending, content_key, version)[start:start + page_size]]
+    st.dataframe(rows[shown], use_container_width=True)
+    st.caption(f"Rows {min(start + 1, len(df))}-{min(start + page_size, len(df))} of {len(df)}")
+
+
+# Tableau paginé de la sélection lu dans la base SQLite : filtres (dates, valeurs, zone), tri, projection et
+# pagination faits par la requête, seule la page visible est lue. query : arguments de count_lines / query_lines ;
+# le nombre de lignes est compté une fois par clé de sélection (selection).
+def paged_lines(key, all_columns, query, selection, columns=None, page_sizes=(25, 50, 100, 500)):
+    total = cached("line_count", selection, lambda: count_lines(**query))
+    shown, sort_by, descending, start, page_size = page_controls(key, all_columns, total, columns, page_sizes)
+    with stage("table") as record:
+        rows = query_lines(shown, order_by=sort_by, descending=descending, limit=page_size, offset=start, **query) \
+            if shown else pd.DataFrame()
+        record["rows"] = len(rows)
+    st.dataframe(rows, use_container_width=True)
+    st.caption(f"Rows {min(start + 1, total)}-{min(start + page_size, total)} of {total}")
+
+
+# Planificateur de tournée : ordre de visite des points de vente d'un agent dans la sélection, calculé sur le
+# serveur (plus proche voisin + 2-opt, distances à vol d'oiseau), tracé sur une carte et exporté en CSV / GPX.
+# outlet_ids (_index -> point de vente canonique) : un seul arrêt par point de vente, à sa dernière position.
+def route_planner(df, outlet_ids, agent_column="Nom et prénom de l'agent", label_column="Nom de l'établissement",
+                  columns=("Nom de l'établissement", "Quartier", "Commune", "Numéro de téléphone"), version=None):
+    from streamlit_folium import st_folium
+
+    from map_builder import route_map
+
+    agents = sorted(df[agent_column].dropna().astype(str).unique())
+    if not agents:
+        st.info("Aucun point de vente dans la sélection.")
+        return
+    agent = st.selectbox("Agent", agents, key="route_agent")
+    stops = df[df[agent_column].astype(str) == agent]
+    stops = with_coordinates(stops).drop_duplicates("_index", keep="last")
+    stops = stops.assign(_outlet=stops["_index"].map(outlet_ids)).drop_duplicates("_outlet", keep="last")
+    if stops.empty:
+        st.info("Aucun point de vente géolocalisé pour cet agent.")
+        return
+    col1, col2, col3 = st.columns(3)
+    start_lat = col1.number_input("Latitude de départ", value=float(stops[LAT].mean()), format="%.6f",
+                                  key=f"route_lat_{agent}")
+    start_lon = col2.number_input("Longitude de départ", value=float(stops[LON].mean()), format="%.6f",
+                                  key=f"route_lon_{agent}")
+    return_to_start = col3.checkbox("Retour au point de départ", key="route_return")
+    with stage("route") as record:
+        route, total = cached("route", (frame_key(stops, version), start_lat, start_lon, return_to_start),
+                              lambda: plan_route(stops, start_lat, start_lon, return_to_start))
+        record["rows"] = len(route)
+    st.caption(f"{len(route)} arrêts, {total:.1f} km à vol d'oiseau")
+    st_folium(route_map(route, start_lat, start_lon, label_column, return_to_start), key="route_map",
+              returned_objects=[], use_container_width=True)
+    table = route_table(route, columns)
+    paged_table(table, key="route_table", content_key=True)
+    col1, col2 = st.columns(2)
+    col1.download_button("📥 Download route (CSV)", table.to_csv(index=False).encode("utf-8"),
+                         file_name=f"tournée_{agent}.csv", mime="text/csv", key="route_csv")
+    col2.download_button("📥 Download route (GPX)", route_gpx(route, start_lat, start_lon, agent, return_to_start),
+                         file_name=f"tournée_{agent}.gpx", mime="application/gpx+xml", key="route_gpx")
+
+
+# Sections affichées, choisies dans la barre latérale : le code d'une section (calculs et imports lourds :
+# folium, Plotly) ne s'exécute que si elle est affichée, contrairement au contenu d'un st.expander
+def section_picker(names, default):
+    st.session_state.setdefault("sections", list(default))
+    return set(st.sidebar.multiselect("Sections", names, key="sections"))
+
+
+# Zone géographique : formes dessinées sur la carte et rayon autour d'un point (ex. un dépôt).
+# st_folium garde ses dernières formes dans l'état de session : effacer la zone change la clé de la carte,
+# sans quoi les formes effacées reviendraient à la relance suivante. Renvoie les formes et la clé de la carte.
+def zone_picker():
+    map_key = f"pdv_map_{st.session_state.setdefault('pdv_map_generation', 0)}"
+    drawn = (st.session_state.get(map_key) or {}).get("all_drawings")
+    if drawn:
+        st.session_state["zone_shapes"] = drawn
+    with st.sidebar.expander("Zone géographique"):
+        zone_lat = st.number_input("Latitude du centre", value=0.0, format="%.6f")
+        zone_lon = st.number_input("Longitude du centre", value=0.0, format="%.6f")
+        zone_km = st.number_input("Rayon (km)", min_value=0.0, value=0.0, step=0.5)
+        if st.button("Effacer les formes dessinées"):
+            st.session_state["zone_shapes"] = []
+            st.session_state["pdv_map_generation"] += 1
+            map_key = f"pdv_map_{st.session_state['pdv_map_generation']}"
+    zone_shapes = list(st.session_state.get("zone_shapes", []))
+    if zone_km > 0:
+        zone_shapes.append(circle_feature(zone_lat, zone_lon, zone_km))
+    return zone_shapes, map_key
+
+
+# Sélection de la relance : intersection des masques de date et de valeurs, puis de la zone géographique.
+# La version est celle lue en début de relance ; les sélections voisines (préchargement) ne changent que les filtres.
+class Selection:
+    def __init__(self, filter_index, version, start, end, date_mask, zone_shapes):
+        self.filter_index = filter_index
+        self.version = version
+        self.start, self.end = start, end
+        self.date_mask = date_mask
+        self.zone_shapes = zone_shapes
+        self.zone_key = json.dumps(zone_shapes, sort_keys=True)
+
+    # Sélection partagée entre les sessions : une relance sans changement de filtres ne refiltre pas
+    def key(self, filters):
+        selected = tuple((col, tuple(sel)) for col, sel in filters.items())
+        return self.version, self.start, self.end, selected, self.zone_key
+
+    def zone_keys(self):
+        return load_spatial_index(self.version).query_features(self.zone_shapes) if self.zone_shapes else None
+
+    def _select(self, filters):
+        rows = self.filter_index.filter(self.date_mask, filters)
+        if self.zone_shapes:
+            rows = rows[rows["_index"].isin(self.zone_keys())]
+        return rows
+
+    def rows(self, filters):
+        return cached("filtered", self.key(filters), lambda: self._select(filters))
+
+    # Même sélection poussée dans la base SQLite (tableaux paginés : seule la page affichée est lue)
+    def query(self, filters):
+        return dict(start=self.start, end=self.end, filters=filters, keys=self.zone_keys())
+
+
+# Pondérations proposées pour la heatmap de la carte
+HEAT_WEIGHTS = {"Prix de vente total": "Prix de vente total de ${Sorte_caracteristic}",
+                "Quantite totale": "Quantite totale de ${Sorte_caracteristic}"}
+# Champs de récence ajoutés aux infobulles de la carte de chaque tableau de bord
+RECENCY_FIELDS = [("Dernière visite", LAST_VISIT), ("Visites (30 j)", window_column(30)), ("Ventes totales", SALES)]
+
+
+# Carte d'une sélection, réutilisée tant que la sélection ne change pas (folium n'est importé qu'au premier appel).
+# Un marqueur par point de vente, et non par ligne de vente, coloré selon la récence de la dernière visite
+# (vert : moins de 30 jours). map_options : titre, colonnes et champs propres au tableau de bord (build_map).
+def map_stage(df, heat_weight, selection, map_options):
+    from map_builder import build_map
+
+    version = selection.version
+    recency, outlet_ids = load_recency(version=version), load_outlet_ids(version)
+    options = dict(map_options, fields=list(map_options["fields"]) + RECENCY_FIELDS)
+    key = (frame_key(df, version), heat_weight, selection.zone_key, json.dumps(options, sort_keys=True), date.today())
+    return cached("map", key, lambda: build_map(
+        with_recency(pdv_view(df), recency, outlet_ids),
+        color_column=COLOR,
+        shapes=selection.zone_shapes,
+        heat_weight_column=HEAT_WEIGHTS.get(heat_weight),
+        **options,
+    ))
+
+
+# Préparation d'une sélection pour les sections affichées : carte, agrégats des graphiques et, si un export a déjà
+# été demandé, fichier d'export. Exécutée en arrière-plan ; le jeton `cancelled` est consulté entre deux étages.
+def prepare(rows, selection, map_options, sections, heat_weight, export_format, cancelled):
+    steps = []
+    if "Mapping" in sections:
+        steps.append(lambda: map_stage(rows, heat_weight, selection, map_options))
+    if sections & {"Charts", "Overview"}:
+        steps.append(lambda: chart_data(rows, selection.version))
+    if export_format:
+        steps.append(lambda: export_bytes(rows, export_format, selection.version))
+    for step in steps:
+        if cancelled.is_set():
+            return
+        step()
+
+
+# Sélection voisine : la sélection courante restreinte à une commune, filtrée puis préparée
+def prefetch_commune(commune, filters, selection, map_options, sections, heat_weight, export_format):
+    neighbour = dict(filters, Commune=[commune])
+
+    def task(cancelled):
+        rows = selection.rows(neighbour)
+        if not cancelled.is_set():
+            prepare(rows, selection, map_options, sections, heat_weight, export_format, cancelled)
+    return task
+
+
+# Pendant le rendu, le pool prépare la sélection affichée puis chacune de ses communes les plus fréquentes
+# (clic suivant probable) ; une section qui attend un étage déjà en cours en reprend le résultat au lieu de le
+# recalculer. Un nouveau changement de filtres annule les tâches encore en attente de la session.
+# export_key : clé du bouton d'export de la sélection (format déjà demandé).
+def prefetch_selection(rows, filters, selection, map_options, shown, export_key="download_filtered_data"):
+    heat_weight = st.session_state.get("heat_weight", "Aucune")
+    export_format = st.session_state.get(f"{export_key}_format") if st.session_state.get(f"{export_key}_ready") else None
+    sections = frozenset(shown)
+    communes = [c for c in rows["Commune"].dropna().value_counts().index[:PREFETCH_NEIGHBOURS]
+                if filters["Commune"] != [c]]
+    schedule(st.session_state.setdefault("prefetch_session", uuid4().hex),
+             (selection.key(filters), sections, heat_weight, export_format),
+             [lambda cancelled: prepare(rows, selection, map_options, sections, heat_weight, export_format, cancelled)]
+             + [prefetch_commune(c, filters, selection, map_options, sections, heat_weight, export_format)
+                for c in communes])
+
+
+# Panneau de profilage optionnel (barre latérale) : étages de la relance en cours, à appeler en fin de script
+def profiling_panel(memory_report=None):
+    if not st.sidebar.checkbox("Show profiling", key="profiling_panel"):
+        return
+    stages = current_profile()
+    table = pd.DataFrame([{
+        "Stage": record["stage"],
+        "Seconds": round(record["seconds"], 4),
+        "Rows": record["rows"],
+        "Memory delta (MB)": None if record["memory_delta"] is None else round(record["memory_delta"] / 1e6, 1),
+    } for record in stages], columns=["Stage", "Seconds", "Rows", "Memory delta (MB)"]).astype({"Rows": "Int64"})
+    st.sidebar.dataframe(table, hide_index=True, use_container_width=True)
+    st.sidebar.caption(f"Script run: {run_seconds():.3f} s")
+    # Mémoire de la vue au grain ligne de vente, avant et après compactage des types
+    if memory_report is not None:
+        before, after = memory_report["avant (octets)"].sum(), memory_report["après (octets)"].sum()
+        st.sidebar.caption(f"Line view: {before / 1e6:.1f} MB -> {after / 1e6:.1f} MB ({before / max(after, 1):.1f}x)")
+        st.sidebar.dataframe(memory_report, use_container_width=True)
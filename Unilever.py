@@ -1,14 +1,15 @@
 import streamlit as st
 import pandas as pd
-import folium
-from folium.plugins import MarkerCluster, HeatMap, Fullscreen, Draw
-from streamlit_folium import folium_static
-import plotly.express as px
 from datetime import date, timedelta
 from UI import *
 from add_data import *
-import plotly.graph_objects as go
-import io
+from ingestion import ingest_new_exports, lines_memory_report, load_cube, load_outlet_ids, load_recency
+from filter_engine import load_filter_index
+from search_index import load_search_index
+from aggregations import chart_data
+from rollups import FREQUENCIES, LINES, PRICE_MEAN, PRICE_SUM, QTY_MEAN, QTY_SUM, rollup
+from frequency import DAYS_SINCE
+from metrics import begin_run, stage, start_metrics_server
 
 # Configuration de la page
 st.set_page_config(page_title="Unilever", page_icon="🌍", layout="wide")
@@ -16,15 +17,15 @@ st.header(":bar_chart: Unilever Dashboard")
 
 
 
-# Nom du fichier
-file_name = 'Unilever_-_all_versions_-_labels_-_2024-11-28-12-22-34.xlsx'
+# Profil de la relance : durée, lignes et mémoire de chaque étage (endpoint Prometheus + panneau optionnel)
+start_metrics_server()
+begin_run("Unilever")
 
-# Charger les feuilles du fichier Excel
-df_unilever = pd.read_excel(file_name, sheet_name='Unilever')
-df_gpi = pd.read_excel(file_name, sheet_name='GPI')
-df_sondage = pd.read_excel(file_name, sheet_name='Sondage')
-
-print("Fichiers chargés avec succès.")
+# Intégrer les nouveaux exports Kobo déposés dans le dossier de dépôt, sans attendre une intégration déjà en
+# cours dans un autre processus (la version courante est alors servie). La version est lue une seule fois : tous
+# les étages de la relance (index de filtrage et de recherche, cube, récence) portent sur les mêmes données.
+with stage("load"):
+    version = ingest_new_exports(wait=False)
 
 
 
@@ -38,245 +39,247 @@ df_unilever_cols = ["_index", "_submission_time", "Nom et prénom de l'agent", "
 df_gpi_cols = ["_index", "Selectionner Parmis ces categories"]
 df_sondage_cols = ["_index", "Sorte_caracteristic", "Quantite totale de ${Sorte_caracteristic}", "Prix de vente total de ${Sorte_caracteristic}"]
 
-# Extraire seulement les colonnes nécessaires pour réduire la taille des DataFrames
-df_unilever = df_unilever[df_unilever_cols]
-df_gpi = df_gpi[df_gpi_cols]
-df_sondage = df_sondage[df_sondage_cols]
+# Jointure matérialisée, calculée une fois par version des données : une ligne par ligne de Sondage,
+# chaque point de vente n'y est rattaché qu'une fois (pas de produit cartésien GPI x Sondage).
+# L'index de filtrage (codes, listes de lignes par valeur, dates triées) est construit en même temps.
+with stage("merge") as record:
+    filter_index = load_filter_index(df_unilever_cols, df_gpi_cols + df_sondage_cols, version)
+    record["rows"] = len(filter_index)
+df_merged = filter_index.df
 
-# Fusionner les DataFrames (corriger l'identifiant de fusion si nécessaire)
-df_merged = pd.merge(df_unilever, df_gpi, on='_index', how='left')
-df_merged = pd.merge(df_merged, df_sondage, on='_index', how='left')
+if df_merged.empty:
+    st.error("Aucun export Kobo n'a encore été intégré.")
+    st.stop()
+
+print("Fichiers chargés avec succès.")
 
 # Filtrage par date
 date1 = st.sidebar.date_input("Choose a start date")
 date2 = st.sidebar.date_input("Choose an end date")
 date1 = pd.to_datetime(date1)
 date2 = pd.to_datetime(date2) + pd.Timedelta(days=1) - pd.Timedelta(seconds=1)
-df_filtered = df_merged[(df_merged["_submission_time"] >= date1) & (df_merged["_submission_time"] <= date2)]
+date_mask = filter_index.date_mask(date1, date2)
 
-# Filtres supplémentaires
+# Filtres supplémentaires (listes d'options lues dans le dictionnaire de l'index)
 st.sidebar.header("Additional filters :")
 filters = {
-    "Commune": st.sidebar.multiselect("Commune", sorted(df_filtered["Commune"].unique())),
-    "Quartier": st.sidebar.multiselect("Quartier", sorted(df_filtered["Quartier"].unique())),
-    "Nom et prénom de l'agent": st.sidebar.multiselect("Agent", sorted(df_filtered["Nom et prénom de l'agent"].unique())),
-    "Selectionner Parmis ces categories": st.sidebar.multiselect("Categorie produit", sorted(df_filtered["Selectionner Parmis ces categories"].unique())),
-    "Sorte_caracteristic": st.sidebar.multiselect("Produit", sorted(df_filtered["Sorte_caracteristic"].astype(str).unique()))  # Conversion en str
+    "Commune": st.sidebar.multiselect("Commune", filter_index.options("Commune", date_mask)),
+    "Quartier": st.sidebar.multiselect("Quartier", filter_index.options("Quartier", date_mask)),
+    "Nom et prénom de l'agent": st.sidebar.multiselect("Agent", filter_index.options("Nom et prénom de l'agent", date_mask)),
+    "Selectionner Parmis ces categories": st.sidebar.multiselect("Categorie produit", filter_index.options("Selectionner Parmis ces categories", date_mask)),
+    "Sorte_caracteristic": st.sidebar.multiselect("Produit", filter_index.options("Sorte_caracteristic", date_mask))
 }
 
-for col, selection in filters.items():
-    if selection:
-        df_filtered = df_filtered[df_filtered[col].isin(selection)]
-
-# Bloc analytique
-with st.expander("VIEW EXCEL DATASET"):
-    showData = st.multiselect('Filter: ', df_filtered.columns, default=df_unilever_cols)
-    st.dataframe(df_filtered[showData], use_container_width=True)
-
-
-# Convertir le DataFrame filtré en un fichier Excel en mémoire
-output = io.BytesIO()
-with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
-    df_filtered.to_excel(writer, index=False)
-
-# Obtenir le contenu du fichier Excel en mémoire
-processed_data = output.getvalue()
-
-# Bouton pour télécharger les données filtrées en format Excel avec une clé unique
-st.download_button(
-    label="📥 Download filtered data in Excel format",
-    data=processed_data,
-    file_name="données_filtrées.xlsx",
-    mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-    key="download_filtered_data"  # Clé unique pour éviter les conflits d'ID
+# Zone géographique (formes dessinées sur la carte, rayon autour d'un point) et sélection de la relance
+zone_shapes, map_key = zone_picker()
+selection = Selection(filter_index, version, date1, date2, date_mask, zone_shapes)
+
+with stage("filter") as record:
+    df_filtered = selection.rows(filters)
+    record["rows"] = len(df_filtered)
+
+# Infobulles de la carte (les champs de récence sont ajoutés par map_stage)
+MAP_OPTIONS = dict(
+    title="Informations sur",
+    title_column="Nom de l'établissement",
+    tooltip_column="Nom de l'établissement",
+    fields=[
+        ("Nom de l'agent", "Nom et prénom de l'agent"),
+        ("Nom et prénom du proprietaire?", "Propriètaire"),
+        ("Type du PDV", "Type du PDV"),
+        ("Commune", "Commune"),
+        ("Quartier", "Quartier"),
+        ("Adresse", "Adresse du PDV"),
+        ("Produit", "Sorte_caracteristic"),
+        ("Quantite", "Quantite totale de ${Sorte_caracteristic}"),
+        ("Prix", "Prix de vente total de ${Sorte_caracteristic}"),
+        ("Numéro de téléphone", "Numéro de téléphone"),
+        ("Date d'enregistrement", "_submission_time"),
+    ],
+    directions=True,
 )
 
-# Affichage de la carte
-with st.expander("Mapping"):
-    if df_filtered['_Prendre les coordonnées du point de vente_latitude'].isnull().all() or \
-       df_filtered['_Prendre les coordonnées du point de vente_longitude'].isnull().all():
-        st.error("Les coordonnées de localisation sont toutes manquantes.")
-    else:
-        latitude_mean = df_filtered['_Prendre les coordonnées du point de vente_latitude'].mean()
-        longitude_mean = df_filtered['_Prendre les coordonnées du point de vente_longitude'].mean()
-        m = folium.Map(location=[latitude_mean, longitude_mean], zoom_start=4)
-        marker_cluster = MarkerCluster().add_to(m)
-
-        for _, row in df_filtered.iterrows():
-            if pd.notnull(row['_Prendre les coordonnées du point de vente_latitude']) and \
-               pd.notnull(row['_Prendre les coordonnées du point de vente_longitude']):
-                
-                # Vérification de la date d'achat
-                date_achat_str = row.get("_submission_time", None)
-                popup_color = "gray"  # Couleur par défaut si la date est inconnue
-                
-                # if date_achat_str:
-                #     try:
-                #         # Convertir la chaîne en objet datetime
-                #         date_achat = datetime.strptime(date_achat_str, "%Y-%m-%d %H:%M:%S")
-                #         today = datetime.now()
-                #         difference = today - date_achat
-
-                #         # Vérifier si la date d'achat est dans le dernier mois ou plus
-                #         if difference.days <= 30:  # Achat dans le dernier mois
-                #             popup_color = "green"
-                #         else:  # Plus d'un mois
-                #             popup_color = "red"
-                #     except ValueError:
-                #         # Gérer les dates mal formatées
-                #         st.warning(f"Date incorrecte pour le PDV : {row['Nom de l'établissement']}")
-                # else:
-                #     st.warning("Aucune date d'achat fournie.")
-
-
-
-                # Lien Google Maps
-                google_maps_url = f"https://www.google.com/maps/dir/?api=1&origin=YOUR_LATITUDE,YOUR_LONGITUDE&destination={row['_Prendre les coordonnées du point de vente_latitude']},{row['_Prendre les coordonnées du point de vente_longitude']}&travelmode=driving"
-
-                popup_content = f"""
-                    <h3>Informations sur {row["Nom de l'établissement"]}</h3>
-                    <div style='color:{popup_color}; font-size:14px;'>
-                        <b>Nom de l'agent :</b> {row["Nom et prénom de l'agent"]}<br>
-                        <b>Nom et prénom du proprietaire? :</b> {row["Propriètaire"]}<br>
-                        <b>Type du PDV :</b> {row['Type du PDV']}<br>
-                        <b>Commune :</b> {row['Commune']}<br>
-                        <b>Quartier :</b> {row['Quartier']}<br>
-                        <b>Adresse :</b> {row["Adresse du PDV"]}<br>
-                        <b>Produit :</b> {row["Sorte_caracteristic"]}<br>
-                        <b>Quantite :</b> {row["Quantite totale de ${Sorte_caracteristic}"]}<br>
-                        <b>Prix :</b> {row["Prix de vente total de ${Sorte_caracteristic}"]}<br>
-                        <b>Numéro de téléphone :</b> {row["Numéro de téléphone"]}<br>
-                        <b>Date d'enregistrement :</b> {row['_submission_time']}<br>
-                        <b>Voir sur la carte :</b> <a href="{google_maps_url}" target="_blank">Cliquer ici pour obtenir l'itinéraire vers ce point de vente</a>
-                    </div>
-                """
-
-                # Choisir une icône selon le statut
-                icon_color = "green" if popup_color == "green" else "red"
-
-                folium.Marker(
-                    location=[row['_Prendre les coordonnées du point de vente_latitude'], 
-                              row['_Prendre les coordonnées du point de vente_longitude']],
-                    tooltip=row["Nom de l'établissement"],
-                    icon=folium.Icon(color=icon_color, icon='fa-dollar-sign', prefix='fa')
-                ).add_to(marker_cluster).add_child(folium.Popup(popup_content, max_width=600))
-
-        # Ajout de la heatmap
-        heat_data = [[row['_Prendre les coordonnées du point de vente_latitude'], 
-                      row['_Prendre les coordonnées du point de vente_longitude']] 
-                     for _, row in df_filtered.iterrows()
-                     if pd.notnull(row['_Prendre les coordonnées du point de vente_latitude']) and 
-                        pd.notnull(row['_Prendre les coordonnées du point de vente_longitude'])]
-        if heat_data:
-            HeatMap(heat_data).add_to(m)
-        Fullscreen(position='topright').add_to(m)
-        Draw(export=True).add_to(m)
-
-        # Affichage de la carte
-        folium_static(m)
+# Sections rendues à la demande (barre latérale) : une section masquée ne calcule ni n'importe rien ;
+# la première page ne construit que le tableau et les graphiques principaux
+SECTIONS = ["VIEW EXCEL DATASET", "Mapping", "Route planner", "Outlets not visited in N days", "Filter Excel Dataset",
+            "Charts", "Trends", "Overview"]
+shown = section_picker(SECTIONS, default=["VIEW EXCEL DATASET", "Charts"])
+
+# Préparation en arrière-plan de la sélection affichée et de ses communes les plus fréquentes
+prefetch_selection(df_filtered, filters, selection, MAP_OPTIONS, shown)
+
+# Bloc analytique
+# Tableaux paginés : seule la page visible est envoyée au navigateur
+if "VIEW EXCEL DATASET" in shown:
+    with st.expander("VIEW EXCEL DATASET", expanded=True):
+        paged_lines("dataset_table", df_filtered.columns, selection.query(filters), selection.key(filters),
+                    columns=df_unilever_cols)
+
+
+# Export des données filtrées (Excel, CSV, Parquet ou archive zip), généré uniquement à la demande
+export_download(df_filtered, key="download_filtered_data", version=version)
+
+# Affichage de la carte (folium n'est importé que si la section est affichée)
+if "Mapping" in shown:
+    from streamlit_folium import st_folium
+
+    with st.expander("Mapping", expanded=True):
+        # Un marqueur par point de vente, et non par ligne de vente ; carte réutilisée tant que la sélection ne change pas
+        heat_weight = st.selectbox("Pondération de la heatmap", ["Aucune"] + list(HEAT_WEIGHTS),
+                                   key="heat_weight")
+        with stage("map"):
+            m = map_stage(df_filtered, heat_weight, selection, MAP_OPTIONS)
+        if m is None:
+            st.error("Les coordonnées de localisation sont toutes manquantes.")
+        else:
+            # Affichage de la carte
+            # Les formes dessinées sont renvoyées au script et filtrent les données à la relance suivante
+            st_folium(m, key=map_key, returned_objects=["all_drawings"], use_container_width=True)
+
+
+# Tournée de visite d'un agent sur les points de vente filtrés, sans service de routage externe
+if "Route planner" in shown:
+    with st.expander("Route planner", expanded=True):
+        route_planner(df_filtered, load_outlet_ids(version), version=version)
+
+# Points de vente sans visite depuis N jours, lus dans la table de récence (une ligne par point de vente)
+if "Outlets not visited in N days" in shown:
+    with st.expander("Outlets not visited in N days", expanded=True):
+        stale_days = st.number_input("N (jours)", min_value=0, value=30, step=1, key="stale_days")
+        stale = load_recency(version=version)
+        stale = stale[stale[DAYS_SINCE] >= stale_days]
+        for col in ("Commune", "Quartier", "Nom et prénom de l'agent"):
+            if filters[col]:
+                stale = stale[stale[col].isin(filters[col])]
+        st.caption(f"{len(stale)} points de vente sans visite depuis au moins {stale_days} jours")
+        paged_table(stale.sort_values(DAYS_SINCE, ascending=False, ignore_index=True), key="stale_outlets_table",
+                    content_key=True)
 
 
 # Load dataset and filters
 def UI():
     st.markdown("""<h3 style="color:#002B50;">⚛  BUSINESS ANALYTICS DASHBOARD</h3>""", unsafe_allow_html=True)
 
-if df_filtered is not None and not df_filtered.empty:
-    with st.expander("VIEW EXCEL DATASET"):
-        showData = st.multiselect('Filter: ', df_filtered.columns, default=df_unilever_cols)
-        st.dataframe(df_filtered[showData], use_container_width=True)
-
-
-# Filtrage et affichage des données
-with st.expander("Filter Excel Dataset"):
-    filtered_df = dataframe_explorer(df_filtered, case=False)
-    st.dataframe(filtered_df, use_container_width=True)
-
-# Convertir le DataFrame filtré en un fichier Excel en mémoire
-output = io.BytesIO()
-with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
-    filtered_df.to_excel(writer, index=False)
-processed_data = output.getvalue()
-
-# Bouton pour télécharger les données filtrées en format Excel
-st.download_button(
-    label="📥 Download filtered data in Excel format",
-    data=processed_data,
-    file_name="données_filtrées.xlsx",
-    mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-)
+# Filtrage et affichage des données ; sans la section, les graphiques portent sur toute la sélection
+filtered_df = df_filtered
+if "Filter Excel Dataset" in shown:
+    # Index de recherche construit au premier affichage de l'explorateur (une fois par version des données)
+    search_index = load_search_index(df_unilever_cols, df_gpi_cols + df_sondage_cols, version)
+    with st.expander("Filter Excel Dataset", expanded=True):
+        filtered_df = dataframe_explorer(df_filtered, search_index, case=False)
+        paged_table(filtered_df, key="explorer_table", version=version)
+
+    # Export des données explorées (Excel, CSV, Parquet ou archive zip), généré uniquement à la demande
+    export_download(filtered_df, key="download_explored_data", version=version)
+
+# Séries agrégées (produit, agent, catégorie, commune, jour) et total partagé, calculés une fois par sélection
+if shown & {"Charts", "Overview"}:
+    with stage("charts") as record:
+        chart = chart_data(filtered_df, version)
+        record["rows"] = len(filtered_df)
+
+# Graphiques (Plotly n'est importé que si une section de graphiques est affichée)
+if "Charts" in shown:
+    import plotly.express as px
+    import plotly.graph_objects as go
 
-# Supposons que 'filtered_df' est déjà défini dans votre code.
-
-# Graphiques
-col1, col2 = st.columns(2)
-
-# Graphe à barres
-with col1:
-    total_sales = filtered_df['Prix de vente total de ${Sorte_caracteristic}'].sum()  # Total des ventes
-    fig2 = go.Figure(
-        data=[go.Bar(x=filtered_df['Sorte_caracteristic'].astype(str),  
-                      y=filtered_df['Prix de vente total de ${Sorte_caracteristic}'].astype(float))],
-        layout=go.Layout(
-            title=go.layout.Title(text="Sales by Product Type"),
-            plot_bgcolor='rgba(0, 0, 0, 0)',
-            paper_bgcolor='rgba(0, 0, 0, 0)',
-            xaxis=dict(showgrid=True, gridcolor='#cecdcd'),
-            yaxis=dict(showgrid=True, gridcolor='#cecdcd'),
-            font=dict(color='#cecdcd'),
+    col1, col2 = st.columns(2)
+
+    # Graphe à barres
+    with col1:
+        total_sales = chart['total']  # Total des ventes
+        fig2 = go.Figure(
+            data=[go.Bar(x=chart['product']['Sorte_caracteristic'].astype(str),
+                          y=chart['product']['Prix de vente total de ${Sorte_caracteristic}'].astype(float))],
+            layout=go.Layout(
+                title=go.layout.Title(text="Sales by Product Type"),
+                plot_bgcolor='rgba(0, 0, 0, 0)',
+                paper_bgcolor='rgba(0, 0, 0, 0)',
+                xaxis=dict(showgrid=True, gridcolor='#cecdcd'),
+                yaxis=dict(showgrid=True, gridcolor='#cecdcd'),
+                font=dict(color='#cecdcd'),
+            )
         )
-    )
-    # Ajouter le total des ventes sur le graphique
-    fig2.add_annotation(
-        xref='paper', yref='paper',
-        x=0.5, y=1.1,
-        text=f"Total: ${total_sales:,.2f}",
-        showarrow=False,
-        font=dict(size=14, color='black'),
-        bgcolor='rgba(255, 255, 255, 0.7)',
-        bordercolor='black',
-        borderwidth=1,
-        borderpad=4,
-    )
-    st.plotly_chart(fig2, use_container_width=True)
-
-# Graphe à secteurs (pie chart)
-with col2:
-    total_sales_pie = filtered_df['Prix de vente total de ${Sorte_caracteristic}'].sum()  # Total pour le pie chart
-    fig = px.pie(filtered_df, values='Prix de vente total de ${Sorte_caracteristic}', 
-                  names="Nom et prénom de l'agent", title='Total price per agent (%)')
-    fig.update_traces(hole=0.4)
-    fig.update_layout(width=800)
+        # Ajouter le total des ventes sur le graphique
+        fig2.add_annotation(
+            xref='paper', yref='paper',
+            x=0.5, y=1.1,
+            text=f"Total: ${total_sales:,.2f}",
+            showarrow=False,
+            font=dict(size=14, color='black'),
+            bgcolor='rgba(255, 255, 255, 0.7)',
+            bordercolor='black',
+            borderwidth=1,
+            borderpad=4,
+        )
+        st.plotly_chart(fig2, use_container_width=True)
+
+    # Graphe à secteurs (pie chart)
+    with col2:
+        fig = px.pie(chart['agent'], values='Prix de vente total de ${Sorte_caracteristic}', 
+                      names="Nom et prénom de l'agent", title='Total price per agent (%)')
+        fig.update_traces(hole=0.4)
+        fig.update_layout(width=800)
     
-    # Ajouter le total sur le pie chart
-    fig.add_annotation(
-        xref='paper', yref='paper',
-        x=0.5, y=0.5,
-        text=f"Total: ${total_sales_pie:,.2f}",
-        showarrow=False,
-        font=dict(size=14, color='black'),
-        bgcolor='rgba(255, 255, 255, 0.7)',
-        bordercolor='black',
-        borderwidth=1,
-        borderpad=4,
-    )
-    st.plotly_chart(fig, use_container_width=True)
-
-# Gestion des erreurs
-try:
-    pass  # Vous pouvez ajouter votre logique ici si nécessaire
-except Exception as e:
-    st.error(f"Unable to display null, select at least one business location: {e}")
+        # Ajouter le total sur le pie chart
+        fig.add_annotation(
+            xref='paper', yref='paper',
+            x=0.5, y=0.5,
+            text=f"Total: ${total_sales:,.2f}",
+            showarrow=False,
+            font=dict(size=14, color='black'),
+            bgcolor='rgba(255, 255, 255, 0.7)',
+            bordercolor='black',
+            borderwidth=1,
+            borderpad=4,
+        )
+        st.plotly_chart(fig, use_container_width=True)
+
+    # Gestion des erreurs
+    try:
+        pass  # Vous pouvez ajouter votre logique ici si nécessaire
+    except Exception as e:
+        st.error(f"Unable to display null, select at least one business location: {e}")
+
 
+# Tendances : requêtes sur le cube de cumuls (jour x agent x commune x produit), pas sur les lignes brutes
+if "Trends" in shown:
+    import plotly.express as px
+
+    with st.expander("Trends", expanded=True):
+        col1, col2, col3 = st.columns(3)
+        granularity = col1.selectbox("Granularité", list(FREQUENCIES))
+        measures = {"Prix de vente total": PRICE_SUM, "Quantite totale": QTY_SUM, "Prix moyen par ligne": PRICE_MEAN,
+                    "Quantite moyenne par ligne": QTY_MEAN, "Nombre de lignes": LINES}
+        measure = col2.selectbox("Mesure", list(measures))
+        breakdowns = {"Aucun": None, "Agent": "Nom et prénom de l'agent", "Commune": "Commune", "Produit": "Sorte_caracteristic"}
+        breakdown = breakdowns[col3.selectbox("Détail par", list(breakdowns))]
+        with stage("trends") as record:
+            trend = rollup(load_cube(version), FREQUENCIES[granularity], by=[breakdown] if breakdown else [],
+                           start=date1, end=date2, filters=filters)
+            record["rows"] = len(trend)
+        fig_trend = px.line(trend, x="periode", y=measures[measure], color=breakdown, markers=True,
+                            labels={"periode": granularity, measures[measure]: measure})
+        st.plotly_chart(fig_trend, use_container_width=True)
+        st.caption("Filtres appliqués aux tendances : dates, commune, agent et produit.")
 
 # Chargement des données filtrées depuis le DataFrame `filtered_df`
 # Pour cet exemple, on supposera que `filtered_df` est déjà chargé
 # filtered_df = ... (votre filtre appliqué à un DataFrame)
 
 # Exemple d'affichage des graphiques
-if not filtered_df.empty:
+if "Overview" in shown and not filtered_df.empty:
+    import plotly.express as px
+
     # Affichage d'un tableau des données filtrées
     st.write("### Overview of filtered data")
-    st.dataframe(filtered_df)
+    # Sans recherche dans l'explorateur, la sélection est lue page par page dans SQLite
+    if filtered_df is df_filtered:
+        paged_lines("overview_table", df_filtered.columns, selection.query(filters), selection.key(filters),
+                    columns=df_unilever_cols + ["Sorte_caracteristic"])
+    else:
+        paged_table(filtered_df, key="overview_table", columns=df_unilever_cols + ["Sorte_caracteristic"],
+                    version=version)
 
     # Graphiques en colonnes
     col1, col2 = st.columns(2)
@@ -285,7 +288,7 @@ if not filtered_df.empty:
     with col1:
         st.write("### Breakdown of Sales by Product Type")
         fig_pie_product = px.pie(
-            filtered_df, 
+            chart['product'],
             values='Prix de vente total de ${Sorte_caracteristic}', 
             names='Sorte_caracteristic', 
         )
@@ -299,7 +302,7 @@ if not filtered_df.empty:
     with col2:
         st.write("### Breakdown of Sales by Agent")
         fig_pie_agent = px.pie(
-            filtered_df, 
+            chart['agent'],
             values='Prix de vente total de ${Sorte_caracteristic}', 
             names='Nom et prénom de l\'agent', 
 
@@ -317,4 +320,5 @@ if not filtered_df.empty:
         st.error(f"Unable to display null, select at least one business location: {e}")
 
 
-    
+# Panneau de profilage de la relance (case à cocher dans la barre latérale)
+profiling_panel(lines_memory_report(df_unilever_cols, df_gpi_cols + df_sondage_cols, version))
@@ -1,24 +1,118 @@
 #import libraries
+import os
+import sqlite3
+from contextlib import closing
+from datetime import date
+
 import streamlit as st
 import pandas as pd 
+from filelock import FileLock
+
+from sql_store import DB_PATH, connect, create_table, distinct_values, has_table, insert_record, insert_rows, last_rowid, quote
 
 #load data set
+SALES_FILE = "sales.csv"
+# Base des ventes saisies, seule copie de ces données : hors du dossier du stockage Kobo, qui peut être supprimé
+# pour forcer une reconstruction
+SALES_DB = os.environ.get("SALES_DB_PATH", "sales.sqlite")
+SALES_TABLE = "sales"
+SALES_COLUMNS = ["OrderDate", "Region", "City", "Category", "Product", "Quantity", "UnitPrice", "TotalPrice"]
+OPTION_COLUMNS = ["Region", "City", "Category", "Product"]
+
+# Listes d'options des selectbox, lues une seule fois puis tenues à jour à chaque ajout
+_options = {"signature": None, "values": {}}
+
+
+# Ventes déjà saisies dans l'ancienne base du stockage Kobo, reprises une fois ; None si aucune
+def _legacy_sales():
+    if not os.path.exists(DB_PATH) or not has_table(SALES_TABLE):
+        return None
+    with closing(connect()) as conn:
+        return pd.read_sql_query(f"SELECT * FROM {quote(SALES_TABLE)} ORDER BY rowid", conn)
+
+
+# Les ventes sont enregistrées dans leur propre base SQLite ; sales.csv (ou l'ancienne table des ventes du
+# stockage Kobo) sert uniquement à l'initialiser
+def ensure_sales(path=SALES_FILE):
+    if has_table(SALES_TABLE, SALES_DB):
+        return
+    with FileLock(path + ".lock"):
+        if has_table(SALES_TABLE, SALES_DB):
+            return
+        dtypes = {col: "float64" if col in ("Quantity", "UnitPrice", "TotalPrice") else "object" for col in SALES_COLUMNS}
+        seed = _legacy_sales()
+        if seed is None:
+            seed = pd.read_csv(path, dtype=dtypes) if os.path.exists(path) else pd.DataFrame(columns=SALES_COLUMNS).astype(dtypes)
+        with closing(connect(SALES_DB)) as conn, conn:
+            create_table(conn, SALES_TABLE, seed)
+            insert_rows(conn, SALES_TABLE, seed)
+
+
+# Dictionnaire colonne -> valeurs distinctes (ordre d'apparition) ; relu seulement si un autre
+# processus a ajouté des ventes depuis la dernière lecture ou le dernier ajout
+def load_options():
+    ensure_sales()
+    signature = last_rowid(SALES_TABLE, SALES_DB)
+    if signature != _options["signature"]:
+        _options["values"] = {col: dict.fromkeys(distinct_values(SALES_TABLE, col, SALES_DB)) for col in OPTION_COLUMNS}
+        _options["signature"] = signature
+    return {col: list(values) for col, values in _options["values"].items()}
+
+
+# Contrôle des types champ par champ, sans passer par pandas ; renvoie la liste des erreurs
+def validate_record(record):
+    errors = []
+    if not isinstance(record.get("OrderDate"), date):
+        errors.append("OrderDate must be a date")
+    for col in OPTION_COLUMNS:
+        value = record.get(col)
+        if not isinstance(value, str) or not value.strip():
+            errors.append(f"{col} is required")
+    for col in ("Quantity", "UnitPrice"):
+        value = record.get(col)
+        if isinstance(value, bool) or not isinstance(value, (int, float)) or not value > 0:
+            errors.append(f"{col} must be a positive number")
+    return errors
+
+
+# Ajout d'une vente : une insertion SQLite (jamais de réécriture complète), les saisies simultanées
+# sont sérialisées par la base et aucune n'est perdue
+def append_record(record):
+    errors = validate_record(record)
+    if errors:
+        raise ValueError("; ".join(errors))
+    row = {
+        "OrderDate": record["OrderDate"].isoformat(),
+        **{col: record[col].strip() for col in OPTION_COLUMNS},
+        "Quantity": float(record["Quantity"]),
+        "UnitPrice": float(record["UnitPrice"]),
+    }
+    row["TotalPrice"] = round(row["Quantity"] * row["UnitPrice"], 2)
+
+    ensure_sales()
+    rowid = insert_record(SALES_TABLE, row, SALES_DB)
+    # Le cache d'options suit l'ajout sans relecture, s'il était à jour juste avant l'insertion
+    if _options["signature"] == rowid - 1:
+        for col in OPTION_COLUMNS:
+            _options["values"].setdefault(col, {})[row[col]] = None
+        _options["signature"] = rowid
+    return row
 
 
 def add_data():
-   df=pd.read_csv("sales.csv")
+   options=load_options()
    #clear hutumika kufuta form akishasubmit form 
    with st.form("form 2",clear_on_submit=True):
     col1,col2=st.columns(2)
     orderdate=col1.date_input(label="order date")
-    region=col2.selectbox("region",df["Region"].unique())
+    region=col2.selectbox("region",options["Region"])
 
     col11,col22=st.columns(2)
-    city=col11.selectbox("city",df["City"].unique())
-    category=col22.selectbox("category",df["Category"].unique())
+    city=col11.selectbox("city",options["City"])
+    category=col22.selectbox("category",options["Category"])
     
     col111,col222,col333=st.columns(3)
-    product=col111.selectbox("product name",df["Product"].unique())
+    product=col111.selectbox("product name",options["Product"])
     quantity=col222.number_input("quantity")
     unitprice=col333.number_input("unitprice")
     
@@ -28,28 +122,24 @@ def add_data():
     #if btn is clicked
     #validate
     if btn:
-        if orderdate=="" or region=="" or city==""or category==""or product==""or quantity==""or unitprice==""or quantity==0.00 or unitprice==0.00:
-            st.warning("All fields are required")
-            return False
-        else:
-           df = pd.concat([df, pd.DataFrame.from_records([{ 
+        record = {
            'OrderDate': orderdate,
            'Region':region,
            'City':city,
            'Category':category,
            'Product':product,
            'Quantity':quantity,
-           'UnitPrice':float(unitprice),
-           'TotalPrice':float(quantity)*float(unitprice),
-           }])])
+           'UnitPrice':unitprice,
+        }
+        if validate_record(record):
+            st.warning("All fields are required")
+            return False
         try:
-            df.to_csv("data.csv",index=False)
+            append_record(record)
             st.success(product+ " Has been Added successfully !")
             return True
             
-        except:
+        except (OSError, sqlite3.Error):
             st.warning("Unable to write, Please close your dataset !!") 
             return False
     st.rerun 
-
-
@@ -0,0 +1,31 @@
+import pandas as pd
+
+from materialize import CATEGORY, PRODUCT, QUANTITY, TOTAL_PRICE
+from stage_cache import cached, frame_key
+
+AGENT = "Nom et prénom de l'agent"
+COMMUNE = "Commune"
+DAY = "_submission_day"
+
+# Axes d'agrégation des graphiques : nom -> colonne de regroupement
+GROUPS = {"product": PRODUCT, "agent": AGENT, "category": CATEGORY, "commune": COMMUNE, "day": DAY}
+
+
+def _aggregate(df):
+    values = pd.DataFrame({
+        TOTAL_PRICE: pd.to_numeric(df[TOTAL_PRICE], errors="coerce"),
+        QUANTITY: pd.to_numeric(df[QUANTITY], errors="coerce"),
+    }, index=df.index)
+    data = {"total": float(values[TOTAL_PRICE].sum()), "quantity": float(values[QUANTITY].sum())}
+    for name, col in GROUPS.items():
+        keys = df["_submission_time"].dt.floor("D") if col == DAY else df[col]
+        grouped = values.groupby(keys.rename(col), sort=False, observed=True).sum()
+        data[name] = grouped.sort_values(TOTAL_PRICE, ascending=False).reset_index()
+    data["day"] = data["day"].sort_values(DAY, ignore_index=True)
+    return data
+
+
+# Sommes par produit, agent, catégorie, commune et jour + total partagé, calculées une fois par sélection.
+# Les graphiques ne reçoivent que ces séries agrégées (quelques dizaines de points au plus).
+def chart_data(df, version=None):
+    return cached("chart_data", frame_key(df, version), lambda: _aggregate(df))
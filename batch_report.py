@@ -0,0 +1,151 @@
+import argparse
+import html
+import multiprocessing
+import os
+import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+# Mode batch sans interface : rapports par commune ou par agent, à partir des mêmes étages que le
+# tableau de bord (stockage, jointure, index de filtrage, agrégations). Streamlit, folium et Plotly ne
+# sont jamais importés ; pandas et le stockage ne le sont qu'au premier rapport.
+
+# Colonnes de la vue au grain ligne de vente (identiques à FREQUENCY.py)
+PDV_COLUMNS = ["_index", "_submission_time", "Nom et prénom de l'agent", "Nom de l'établissement", "Numéro de téléphone",
+               "Propriètaire", "Type du PDV", "Province", "Commune", "Quartier",
+               "Adresse du PDV", "Le point de vente est-il nouveau ou ancien?",
+               "Quels sont vos commentaires généraux ou ceux du vendeur sur le point de vente?",
+               "_Prendre les coordonnées du point de vente_latitude",
+               "_Prendre les coordonnées du point de vente_longitude"]
+LINE_COLUMNS = ["_index", "Selectionner Parmis ces categories", "Sorte_caracteristic",
+                "Prix de vente unitaire de ${Sorte_caracteristic}",
+                "Quantite totale de ${Sorte_caracteristic}", "Prix de vente total de ${Sorte_caracteristic}"]
+
+# Axes de découpage des rapports et filtres acceptés en ligne de commande : option -> colonne
+REPORT_BY = {"commune": "Commune", "agent": "Nom et prénom de l'agent", "quartier": "Quartier"}
+FILTER_OPTIONS = {
+    "commune": "Commune",
+    "quartier": "Quartier",
+    "agent": "Nom et prénom de l'agent",
+    "category": "Selectionner Parmis ces categories",
+    "product": "Sorte_caracteristic",
+}
+FORMATS = {"excel": "xlsx", "parquet": "parquet", "html": "html"}
+
+
+def slug(value):
+    return re.sub(r"[^\w-]+", "_", str(value)).strip("_") or "sans_nom"
+
+
+def _date_bounds(index, start, end):
+    import pandas as pd
+
+    times = index.df["_submission_time"]
+    start = times.min() if start is None else pd.Timestamp(start)
+    end = times.max() if end is None else pd.Timestamp(end) + pd.Timedelta(days=1) - pd.Timedelta(seconds=1)
+    return start, end
+
+
+def _index():
+    from filter_engine import load_filter_index
+
+    return load_filter_index(PDV_COLUMNS, LINE_COLUMNS)
+
+
+# Rapport HTML autonome : totaux et tableaux agrégés (sans JavaScript ni Plotly)
+def write_html(df, path, title):
+    from aggregations import chart_data
+
+    data = chart_data(df)
+    title = html.escape(title)
+    sections = [
+        f"<h1>{title}</h1>",
+        f"<p>{len(df)} lignes de vente, {df['_index'].nunique()} points de vente, "
+        f"quantité totale {data['quantity']:,.0f}, ventes totales {data['total']:,.0f}</p>",
+    ]
+    for name, heading in (("product", "Par produit"), ("category", "Par catégorie"),
+                          ("agent", "Par agent"), ("commune", "Par commune")):
+        sections.append(f"<h2>{heading}</h2>")
+        sections.append(data[name].to_html(index=False, float_format=lambda v: f"{v:,.0f}", border=0))
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("<!DOCTYPE html><html><head><meta charset='utf-8'><title>{}</title>"
+                "<style>body{{font-family:sans-serif}} td,th{{padding:2px 8px;text-align:left}}</style>"
+                "</head><body>{}</body></html>".format(title, "\n".join(sections)))
+
+
+# Un rapport (une valeur de l'axe de découpage) ; exécuté dans un processus du pool, qui charge
+# le stockage et l'index une seule fois pour tous les rapports qu'il produit
+def build_report(by, value, start, end, filters, formats, output_dir):
+    from exports import CONSTANT_MEMORY_ROWS, write_parquet, write_xlsx
+
+    started = time.perf_counter()
+    index = _index()
+    start, end = _date_bounds(index, start, end)
+    df = index.filter(index.date_mask(start, end), dict(filters, **{REPORT_BY[by]: [value]}))
+    paths = []
+    for fmt in formats:
+        path = os.path.join(output_dir, f"{by}_{slug(value)}.{FORMATS[fmt]}")
+        if fmt == "excel":
+            write_xlsx(df, path, constant_memory=len(df) > CONSTANT_MEMORY_ROWS)
+        elif fmt == "parquet":
+            write_parquet(df, path)
+        else:
+            write_html(df, path, f"{REPORT_BY[by]} : {value} ({start:%Y-%m-%d} - {end:%Y-%m-%d})")
+        paths.append(path)
+    return value, len(df), paths, time.perf_counter() - started
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Rapports Excel / Parquet / HTML par commune ou par agent, sans interface")
+    parser.add_argument("--by", choices=list(REPORT_BY), default="commune", help="un rapport par valeur de cet axe")
+    parser.add_argument("--start", help="date de début (AAAA-MM-JJ)")
+    parser.add_argument("--end", help="date de fin incluse (AAAA-MM-JJ)")
+    for option, column in FILTER_OPTIONS.items():
+        parser.add_argument(f"--{option}", action="append", default=[], help=f"filtre sur « {column} » (répétable)")
+    parser.add_argument("--formats", nargs="+", choices=list(FORMATS), default=["excel"])
+    parser.add_argument("--output-dir", default="reports")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--no-ingest", action="store_true", help="ne pas intégrer les nouveaux exports avant les rapports")
+    return parser.parse_args(argv)
+
+
+# python batch_report.py --by commune --start 2024-10-01 --formats excel html --workers 4
+def main(argv=None):
+    args = parse_args(argv)
+    filters = {column: getattr(args, option) for option, column in FILTER_OPTIONS.items() if getattr(args, option)}
+
+    if not args.no_ingest:
+        from ingestion import ingest_new_exports
+
+        ingest_new_exports()
+    index = _index()
+    if len(index) == 0:
+        print("Aucun export Kobo n'a encore été intégré.", file=sys.stderr)
+        return 1
+    start, end = _date_bounds(index, args.start, args.end)
+    selected = index.select(index.date_mask(start, end), filters)
+    values = index.options(REPORT_BY[args.by], selected)
+    if not values:
+        print("Aucune donnée pour ces filtres.", file=sys.stderr)
+        return 1
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    failures = 0
+    with ProcessPoolExecutor(max_workers=max(1, min(args.workers, len(values)))) as pool:
+        futures = {pool.submit(build_report, args.by, value, args.start, args.end, filters, args.formats,
+                               args.output_dir): value for value in values}
+        for future in as_completed(futures):
+            try:
+                value, rows, paths, seconds = future.result()
+                print(f"{value} : {rows} lignes, {', '.join(paths)} ({seconds:.1f} s)")
+            except Exception as e:
+                failures += 1
+                print(f"{futures[future]} : échec du rapport ({e})", file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    # Nécessaire pour le pool de processus dans l'exécutable PyInstaller (Windows)
+    multiprocessing.freeze_support()
+    sys.exit(main())
@@ -0,0 +1,379 @@
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+
+import numpy as np
+import xlsxwriter
+
+from data_loader import SHEET_COLUMNS
+
+# Tailles par défaut (nombre de soumissions Kobo) et dossier des classeurs synthétiques
+SIZES = [10_000, 100_000, 1_000_000]
+DATA_DIR = ".bench_data"
+# Limite de lignes d'une feuille Excel (en-tête compris)
+EXCEL_MAX_ROWS = 1_048_576
+# Taille des listes de valeurs Faker tirées au hasard (noms, adresses, commentaires...)
+POOL_SIZE = 5_000
+
+# Colonnes demandées par les tableaux de bord (voir FREQUENCY.py)
+PDV_COLUMNS = SHEET_COLUMNS["Unilever"]
+LINE_COLUMNS = ["_index", "Selectionner Parmis ces categories", "Sorte_caracteristic",
+                "Prix de vente unitaire de ${Sorte_caracteristic}",
+                "Quantite totale de ${Sorte_caracteristic}", "Prix de vente total de ${Sorte_caracteristic}"]
+
+# Démarrage à froid : sections affichées par scénario (None : sections par défaut du tableau de bord)
+COLD_START_SCENARIOS = {
+    "default": None,
+    "dataset": ["VIEW EXCEL DATASET"],
+    "mapping": ["Mapping"],
+    "all": ["VIEW EXCEL DATASET", "Mapping", "Route planner", "Outlets not visited in N days", "Filter Excel Dataset",
+            "Charts", "Trends", "Overview"],
+}
+# Bibliothèques lourdes dont on vérifie qu'elles ne sont importées que par les sections qui les utilisent
+# (Streamlit importe lui-même plotly.graph_objects pour son thème)
+HEAVY_MODULES = ["folium", "streamlit_folium", "plotly.express"]
+
+# Vocabulaire observé dans les exports réels
+AGENTS = 40
+PDV_TYPES = (["Boutique", "Mini-Alimentation", "Alimentation"], [0.78, 0.11, 0.11])
+QUARTIERS = {
+    "Muha": ["Kanyosha", "Musaga", "Kinanira III", "Kinanira IV", "Kibenga", "Kinindo"],
+    "Ntahangwa": ["Kamenge", "Gasenyi", "Ngagara", "Gihosha", "Kigobe", "Gikungu"],
+    "Mukaza": ["Nyakabiga", "Buyenzi", "Bwiza", "Centre ville", "Jabe"],
+}
+PRODUCTS = {
+    "PERSONAL CARE": [("Vaseline PJs 95ml", 5000), ("Vaseline PJs 240ml", 9000), ("Vaseline Lot 400ml", 12000)],
+    "FOOD": [("Royco 200g", 6000), ("Royco 8g (Cases),", 500)],
+    "HOME CARE": [("Vim 500g", 4000)],
+}
+# Nombre de lignes répétées (GPI, Sondage) par soumission : 1 à 4, comme dans les exports réels
+LINES_PER_SUBMISSION = ([1, 2, 3, 4], [0.56, 0.31, 0.10, 0.03])
+
+
+def _counts(rng, submissions):
+    counts = rng.choice(LINES_PER_SUBMISSION[0], size=submissions, p=LINES_PER_SUBMISSION[1])
+    # Une feuille Excel ne dépasse pas EXCEL_MAX_ROWS lignes : on réduit les soumissions multi-lignes
+    excess = counts.sum() - (EXCEL_MAX_ROWS - 1)
+    if excess > 0:
+        counts = np.ones(submissions, dtype=counts.dtype)
+        counts[:max(0, EXCEL_MAX_ROWS - 1 - submissions)] = 2
+        counts = counts[:EXCEL_MAX_ROWS - 1]
+    return counts
+
+
+# Feuilles Unilever, GPI et Sondage d'un export synthétique (colonnes des exports réels)
+def generate_sheets(submissions, seed=0):
+    from faker import Faker
+
+    fake = Faker("fr_FR")
+    Faker.seed(seed)
+    rng = np.random.default_rng(seed)
+    pool = lambda make: np.array([make() for _ in range(POOL_SIZE)], dtype=object)
+    agents = np.array([fake.name() for _ in range(AGENTS)], dtype=object)
+
+    index = np.arange(1, submissions + 1)
+    start = np.datetime64("2023-01-01T07:00:00")
+    seconds = np.sort(rng.integers(0, 2 * 365 * 86400, size=submissions))
+    communes = rng.choice(list(QUARTIERS), size=submissions, p=[0.4, 0.38, 0.22])
+    quartiers = np.empty(submissions, dtype=object)
+    for commune, names in QUARTIERS.items():
+        rows = communes == commune
+        quartiers[rows] = rng.choice(names, size=rows.sum())
+    phones = rng.integers(61_000_000, 80_000_000, size=submissions).astype(float)
+    phones[rng.random(submissions) < 0.3] = np.nan
+
+    unilever = {
+        "_index": index,
+        "_submission_time": start + seconds.astype("timedelta64[s]"),
+        "Nom et prénom de l'agent": rng.choice(agents, size=submissions),
+        "Nom de l'établissement": rng.choice(pool(fake.company), size=submissions),
+        "Numéro de téléphone": phones,
+        "Propriètaire": rng.choice(pool(fake.first_name), size=submissions),
+        "Type du PDV": rng.choice(PDV_TYPES[0], size=submissions, p=PDV_TYPES[1]),
+        "Province": np.full(submissions, "Bujumbura Mairie", dtype=object),
+        "Commune": communes,
+        "Quartier": quartiers,
+        "Adresse du PDV": rng.choice(pool(fake.street_name), size=submissions),
+        "Le point de vente est-il nouveau ou ancien?": rng.choice(["Nouveau", "Ancien"], size=submissions, p=[0.88, 0.12]),
+        "Quels sont vos commentaires généraux ou ceux du vendeur sur le point de vente?":
+            rng.choice(pool(lambda: fake.sentence(nb_words=6)), size=submissions),
+        "_Prendre les coordonnées du point de vente_latitude": rng.normal(-3.38, 0.03, size=submissions),
+        "_Prendre les coordonnées du point de vente_longitude": rng.normal(29.37, 0.02, size=submissions),
+    }
+
+    catalog = [(category, name, price) for category, items in PRODUCTS.items() for name, price in items]
+    counts = _counts(rng, submissions)
+    parents = np.repeat(index[:len(counts)], counts)
+    picks = rng.integers(0, len(catalog), size=len(parents))
+    categories = np.array([catalog[i][0] for i in range(len(catalog))], dtype=object)[picks]
+    names = np.array([catalog[i][1] for i in range(len(catalog))], dtype=object)[picks]
+    prices = np.array([catalog[i][2] for i in range(len(catalog))], dtype=float)[picks]
+    quantities = rng.integers(1, 30, size=len(parents))
+    lines = np.arange(1, len(parents) + 1)
+
+    gpi = {
+        "_index": lines,
+        "_parent_index": parents,
+        "Selectionner Parmis ces categories": categories,
+        "choisissez parmis ces sortes….": names,
+    }
+    sondage = {
+        "_index": lines,
+        "_parent_index": parents,
+        # Kobo remplace les espaces par des "_" dans le nom du produit de la boucle Sondage
+        "Sorte_caracteristic": np.array([name.replace(" ", "_") for name in names], dtype=object),
+        "Prix de vente unitaire de ${Sorte_caracteristic}": prices,
+        "Quantite totale de ${Sorte_caracteristic}": quantities,
+        "Prix de vente total de ${Sorte_caracteristic}": (prices * quantities).astype(np.int64),
+    }
+    return {"Unilever": unilever, "GPI": gpi, "Sondage": sondage}
+
+
+# Valeurs d'une colonne prêtes pour xlsxwriter : dates Python, cellules vides pour les manquants
+def _cells(values):
+    if np.issubdtype(values.dtype, np.datetime64):
+        return values.astype("datetime64[us]").tolist()
+    if np.issubdtype(values.dtype, np.floating):
+        return [None if np.isnan(v) else v for v in values.tolist()]
+    return values.tolist()
+
+
+# Classeur écrit ligne par ligne (constant_memory), dans le format des exports Kobo "labels"
+def write_workbook(sheets, path):
+    workbook = xlsxwriter.Workbook(path, {"constant_memory": True, "default_date_format": "yyyy-mm-dd hh:mm:ss"})
+    for sheet, columns in sheets.items():
+        worksheet = workbook.add_worksheet(sheet)
+        worksheet.write_row(0, 0, SHEET_COLUMNS[sheet])
+        cells = [_cells(columns[col]) for col in SHEET_COLUMNS[sheet]]
+        for row, values in enumerate(zip(*cells), start=1):
+            worksheet.write_row(row, 0, values)
+    workbook.close()
+
+
+# Dossier de dépôt d'une taille donnée, avec son classeur (généré une seule fois par taille et graine)
+def dataset(submissions, seed=0, data_dir=DATA_DIR):
+    drop_dir = os.path.join(data_dir, f"{submissions}_{seed}")
+    path = os.path.join(drop_dir, "Unilever_-_all_versions_-_labels_-bench.xlsx")
+    if not os.path.exists(path):
+        os.makedirs(drop_dir, exist_ok=True)
+        started = time.perf_counter()
+        write_workbook(generate_sheets(submissions, seed), path + ".tmp")
+        os.replace(path + ".tmp", path)
+        print(f"{path} généré en {time.perf_counter() - started:.1f} s", file=sys.stderr)
+    return drop_dir
+
+
+# Mesure d'un étage : durée et pic d'allocations Python/NumPy (tracemalloc) pendant l'étage
+class StageTimer:
+    def __init__(self, trace_memory=True):
+        self.trace_memory = trace_memory
+        self.stages = []
+        if trace_memory:
+            tracemalloc.start()
+
+    def run(self, name, compute, **extra):
+        if self.trace_memory:
+            tracemalloc.reset_peak()
+            baseline = tracemalloc.get_traced_memory()[0]
+        started = time.perf_counter()
+        value = compute()
+        result = {"stage": name, "seconds": round(time.perf_counter() - started, 4)}
+        if self.trace_memory:
+            result["peak_mb"] = round((tracemalloc.get_traced_memory()[1] - baseline) / 1e6, 2)
+        result.update({key: describe(value) for key, describe in extra.items()})
+        self.stages.append(result)
+        print(f"  {name:<12} {result['seconds']:>9.3f} s", file=sys.stderr)
+        return value
+
+
+# Étages du tableau de bord exécutés sans interface, dans l'ordre d'une première visite
+def run_stages(trace_memory=True):
+    import plotly.express as px
+
+    from aggregations import chart_data
+    from dedup import canonical_outlets
+    from exports import excel_bytes
+    from filter_engine import load_filter_index
+    from ingestion import ingest_new_exports, load_lines, load_tables
+    from map_builder import build_map
+    from materialize import PRODUCT, TOTAL_PRICE, pdv_view
+    from search_index import ALL_TEXT_COLUMNS, load_search_index
+
+    timer = StageTimer(trace_memory)
+    timer.run("load", ingest_new_exports)
+    lines = timer.run("merge", lambda: load_lines(PDV_COLUMNS, LINE_COLUMNS), rows=len)
+    index = timer.run("filter_index", lambda: load_filter_index(PDV_COLUMNS, LINE_COLUMNS))
+    # Détection des doublons seule (déjà comprise dans « load ») : coût par ingestion
+    timer.run("dedup", lambda: canonical_outlets(load_tables()[0]), outlets=lambda ids: int(ids.nunique()))
+
+    # Sélection large : toute la période, deux communes sur trois
+    times = lines["_submission_time"]
+    communes = index.options("Commune")[:2]
+    filtered = timer.run("filter", lambda: index.filter(index.date_mask(times.min(), times.max()),
+                                                        {"Commune": communes}), rows=len)
+
+    def search():
+        mask = load_search_index(PDV_COLUMNS, LINE_COLUMNS).search("ka", ALL_TEXT_COLUMNS, "contains", True)
+        return filtered[mask[filtered.index]]
+    timer.run("search", search, rows=len)
+
+    def render_map():
+        m = build_map(pdv_view(filtered), title="Information of", title_column="Propriètaire",
+                      tooltip_column="Propriètaire", fields=[("Type du PDV", "Type du PDV")])
+        return m.get_root().render()
+    timer.run("map", render_map, html_bytes=len)
+
+    def charts():
+        chart = chart_data(filtered)
+        figures = [px.bar(chart["product"], x=PRODUCT, y=TOTAL_PRICE),
+                   px.pie(chart["agent"], values=TOTAL_PRICE, names="Nom et prénom de l'agent")]
+        return "".join(fig.to_json() for fig in figures)
+    timer.run("chart", charts, json_bytes=len)
+
+    timer.run("export_excel", lambda: excel_bytes(filtered), xlsx_bytes=len)
+    return {"submissions": int(lines["_index"].nunique()), "lines": len(lines), "stages": timer.stages}
+
+
+def _commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# Exécution des étages dans un processus neuf : stockage vide, caches froids, mesures indépendantes
+def _run_stages(drop_dir, trace_memory):
+    store_dir = os.path.join(drop_dir, "store")
+    shutil.rmtree(store_dir, ignore_errors=True)
+    env = dict(os.environ, KOBO_DROP_DIR=drop_dir, KOBO_STORE_DIR=store_dir,
+               KOBO_DB_PATH=os.path.join(store_dir, "kobo.sqlite"),
+               KOBO_CACHE_DIR=os.path.join(drop_dir, "cache"))
+    command = [sys.executable, os.path.abspath(__file__), "--stages"] + ([] if trace_memory else ["--no-memory"])
+    output = subprocess.run(command, env=env, capture_output=True, text=True, check=True)
+    sys.stderr.write(output.stderr)
+    return json.loads(output.stdout.splitlines()[-1])
+
+
+# Premier affichage puis relance sans changement d'un tableau de bord, dans le processus courant (neuf),
+# sans navigateur : le stockage est déjà à jour, seuls les caches du processus sont froids
+def run_cold_start(script, scenario):
+    started = time.perf_counter()
+    from streamlit.testing.v1 import AppTest
+
+    imported = time.perf_counter()
+    app = AppTest.from_file(script, default_timeout=600)
+    if COLD_START_SCENARIOS[scenario] is not None:
+        app.session_state["sections"] = COLD_START_SCENARIOS[scenario]
+    app.run()
+    first = time.perf_counter()
+    app.run()
+    rerun = time.perf_counter()
+    return {
+        "scenario": scenario,
+        "streamlit_import_s": round(imported - started, 4),
+        "first_paint_s": round(first - imported, 4),
+        "rerun_s": round(rerun - first, 4),
+        "heavy_modules": [name for name in HEAVY_MODULES if name in sys.modules],
+        "errors": [e.message for e in app.exception],
+    }
+
+
+def _run_cold_start(drop_dir, script, scenario):
+    store_dir = os.path.join(drop_dir, "store")
+    env = dict(os.environ, KOBO_DROP_DIR=drop_dir, KOBO_STORE_DIR=store_dir,
+               KOBO_DB_PATH=os.path.join(store_dir, "kobo.sqlite"),
+               KOBO_CACHE_DIR=os.path.join(drop_dir, "cache"), METRICS_PORT="0")
+    command = [sys.executable, os.path.abspath(__file__), "--cold-run", scenario, "--cold-start", script]
+    output = subprocess.run(command, env=env, capture_output=True, text=True, check=True)
+    return json.loads(output.stdout.splitlines()[-1])
+
+
+# Démarrage à froid par taille : stockage construit une fois, puis un processus neuf par scénario
+def cold_start(script, sizes=SIZES, seed=0, data_dir=DATA_DIR):
+    results = []
+    for submissions in sizes:
+        drop_dir = dataset(submissions, seed, data_dir)
+        shutil.rmtree(os.path.join(drop_dir, "store"), ignore_errors=True)
+        print(f"{submissions} soumissions : construction du stockage", file=sys.stderr)
+        _run_cold_start(drop_dir, script, "dataset")
+        scenarios = []
+        for scenario in COLD_START_SCENARIOS:
+            result = _run_cold_start(drop_dir, script, scenario)
+            print(f"  {scenario:<10} premier affichage {result['first_paint_s']:>8.3f} s, "
+                  f"relance {result['rerun_s']:>7.3f} s", file=sys.stderr)
+            scenarios.append(result)
+        results.append({"size": submissions, "script": script, "scenarios": scenarios})
+    return {
+        "commit": _commit(),
+        "date": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "seed": seed,
+        "results": results,
+    }
+
+
+# Deux passages par taille : durées sans traçage, puis pics mémoire sous tracemalloc (qui ralentit
+# fortement le code Python et fausserait les durées)
+def benchmark(sizes=SIZES, seed=0, data_dir=DATA_DIR, trace_memory=True):
+    results = []
+    for submissions in sizes:
+        drop_dir = dataset(submissions, seed, data_dir)
+        print(f"{submissions} soumissions", file=sys.stderr)
+        result = _run_stages(drop_dir, trace_memory=False)
+        if trace_memory:
+            print("  mémoire (tracemalloc)", file=sys.stderr)
+            traced = _run_stages(drop_dir, trace_memory=True)
+            for stage, memory in zip(result["stages"], traced["stages"]):
+                stage["peak_mb"] = memory["peak_mb"]
+        results.append(dict(size=submissions, **result))
+    return {
+        "commit": _commit(),
+        "date": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "seed": seed,
+        "results": results,
+    }
+
+
+# python benchmark.py --sizes 10000 100000 --output bench.json
+# python benchmark.py --sizes 10000 --cold-start FREQUENCY.py
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark des étages du tableau de bord sur des exports Kobo synthétiques")
+    parser.add_argument("--sizes", type=int, nargs="+", default=SIZES, help="nombres de soumissions")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--data-dir", default=DATA_DIR)
+    parser.add_argument("--output", help="fichier JSON des résultats (sortie standard par défaut)")
+    parser.add_argument("--no-memory", action="store_true", help="durées seulement, sans le passage tracemalloc")
+    parser.add_argument("--cold-start", metavar="SCRIPT", help="démarrage à froid du tableau de bord, par section")
+    parser.add_argument("--stages", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--cold-run", choices=list(COLD_START_SCENARIOS), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.stages:
+        print(json.dumps(run_stages(trace_memory=not args.no_memory)))
+        return
+    if args.cold_run:
+        print(json.dumps(run_cold_start(args.cold_start, args.cold_run)))
+        return
+    if args.cold_start:
+        report = json.dumps(cold_start(args.cold_start, args.sizes, args.seed, args.data_dir), indent=2)
+    else:
+        report = json.dumps(benchmark(args.sizes, args.seed, args.data_dir, not args.no_memory), indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(report + "\n")
+    else:
+        print(report)
+
+
+if __name__ == "__main__":
+    main()
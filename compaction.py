@@ -0,0 +1,75 @@
+import numpy as np
+import pandas as pd
+
+from data_loader import DATETIME_COLUMNS
+
+# Colonne texte convertie en catégorie si elle a au plus cette proportion de valeurs distinctes
+LOW_CARDINALITY = 0.5
+# Clés de jointure : jamais réduites (comparées entre tables et versions)
+KEY_COLUMNS = {"_index", "_parent_index"}
+
+
+# Registre des catégories : colonne -> valeurs dans l'ordre où elles sont apparues.
+# Les nouvelles valeurs sont ajoutées en fin de liste, les codes déjà attribués ne changent pas d'une
+# version des données à l'autre ; une colonne entrée dans le registre y reste.
+def update_categories(registry, frames):
+    registry = {col: list(values) for col, values in registry.items()}
+    for df in frames:
+        for col in df.columns:
+            if col in KEY_COLUMNS or col in DATETIME_COLUMNS or df[col].dtype != object:
+                continue
+            values = df[col].dropna()
+            if col not in registry and values.nunique() > LOW_CARDINALITY * max(len(values), 1):
+                continue
+            known = set(registry.get(col, []))
+            registry[col] = registry.get(col, []) + sorted(set(values.astype(str)) - known)
+    return registry
+
+
+# Entier ou flottant le plus petit qui conserve toutes les valeurs à l'identique
+def downcast(s):
+    if pd.api.types.is_bool_dtype(s):
+        return s
+    if pd.api.types.is_integer_dtype(s):
+        return pd.to_numeric(s, downcast="integer")
+    if pd.api.types.is_float_dtype(s):
+        values = s.to_numpy()
+        with np.errstate(over="ignore"):
+            reduced = values.astype(np.float32)
+        if np.array_equal(reduced.astype(np.float64), values, equal_nan=True):
+            return pd.Series(reduced, index=s.index, name=s.name)
+    return s
+
+
+# Normalisation des types d'une vue chargée : catégories stables, texte dédoublonné, nombres réduits,
+# dates en datetime64.
+# Renvoie la vue compacte et le rapport de mémoire colonne par colonne.
+def compact_frame(df, registry):
+    before = df.memory_usage(index=False, deep=True)
+    columns = {}
+    for col in df.columns:
+        s = df[col]
+        if col in DATETIME_COLUMNS:
+            s = s if pd.api.types.is_datetime64_any_dtype(s) else pd.to_datetime(s, errors="coerce")
+        elif col in registry and s.dtype == object:
+            s = pd.Series(pd.Categorical(s.where(s.isna(), s.astype(str)), categories=registry[col]),
+                          index=df.index, name=col)
+        elif s.dtype == object and col not in KEY_COLUMNS:
+            # Texte répété par la jointure (ex. nom du PDV sur chacune de ses lignes) : catégorie propre
+            # à cette version si elle est assez répétée, sinon chaînes internées (un objet par valeur)
+            distinct = s.dropna().unique()
+            if len(distinct) <= LOW_CARDINALITY * len(s):
+                s = pd.Series(pd.Categorical(s, categories=sorted(distinct, key=str)), index=df.index, name=col)
+            else:
+                s = s.map({value: value for value in distinct}, na_action="ignore")
+        elif col not in KEY_COLUMNS:
+            s = downcast(s)
+        columns[col] = s
+    compact = pd.DataFrame(columns, index=df.index)
+    return compact, memory_report(before, compact.memory_usage(index=False, deep=True), compact.dtypes)
+
+
+def memory_report(before, after, dtypes):
+    report = pd.DataFrame({"type": dtypes.astype(str), "avant (octets)": before, "après (octets)": after})
+    report["gain"] = report["avant (octets)"] / report["après (octets)"].replace(0, np.nan)
+    return report.sort_values("avant (octets)", ascending=False)
@@ -0,0 +1,90 @@
+import hashlib
+import os
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+# Dossier des instantanés Parquet (un fichier par feuille et par version du classeur)
+CACHE_DIR = os.environ.get("KOBO_CACHE_DIR", ".kobo_cache")
+
+# Colonnes lues dans chaque feuille du classeur Kobo (union des besoins des deux tableaux de bord)
+SHEET_COLUMNS = {
+    "Unilever": ["_index", "_submission_time", "Nom et prénom de l'agent", "Nom de l'établissement", "Numéro de téléphone",
+                 "Propriètaire", "Type du PDV", "Province", "Commune", "Quartier",
+                 "Adresse du PDV", "Le point de vente est-il nouveau ou ancien?",
+                 "Quels sont vos commentaires généraux ou ceux du vendeur sur le point de vente?",
+                 "_Prendre les coordonnées du point de vente_latitude",
+                 "_Prendre les coordonnées du point de vente_longitude"],
+    "GPI": ["_index", "_parent_index", "Selectionner Parmis ces categories", "choisissez parmis ces sortes…."],
+    "Sondage": ["_index", "_parent_index", "Sorte_caracteristic", "Prix de vente unitaire de ${Sorte_caracteristic}",
+                "Quantite totale de ${Sorte_caracteristic}", "Prix de vente total de ${Sorte_caracteristic}"],
+}
+
+# Colonnes converties en numérique / en date à la lecture
+NUMERIC_COLUMNS = {"_index", "_parent_index", "Numéro de téléphone",
+                   "_Prendre les coordonnées du point de vente_latitude",
+                   "_Prendre les coordonnées du point de vente_longitude",
+                   "Prix de vente unitaire de ${Sorte_caracteristic}",
+                   "Quantite totale de ${Sorte_caracteristic}",
+                   "Prix de vente total de ${Sorte_caracteristic}"}
+DATETIME_COLUMNS = {"_submission_time"}
+
+
+# Clé d'un instantané : chemin, taille et date de modification du classeur + colonnes demandées
+def snapshot_key(file_name):
+    stat = os.stat(file_name)
+    raw = "|".join([os.path.abspath(file_name), str(stat.st_size), str(stat.st_mtime_ns), repr(sorted(SHEET_COLUMNS.items()))])
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()[:16]
+
+
+def snapshot_path(key, sheet):
+    return os.path.join(CACHE_DIR, f"{key}_{sheet}.parquet")
+
+
+# Typage des colonnes pour obtenir un schéma Arrow stable
+def normalize_types(df):
+    for col in df.columns:
+        if col in NUMERIC_COLUMNS:
+            df[col] = pd.to_numeric(df[col], errors="coerce")
+        elif col in DATETIME_COLUMNS:
+            df[col] = pd.to_datetime(df[col], errors="coerce")
+        elif df[col].dtype == object:
+            # Les colonnes texte peuvent contenir des nombres saisis : tout convertir en str sauf les vides
+            df[col] = df[col].where(df[col].isna(), df[col].astype(str))
+    return df
+
+
+# Lecture d'une feuille du classeur en ne gardant que les colonnes utiles
+def read_sheet(file_name, sheet):
+    wanted = SHEET_COLUMNS[sheet]
+    df = pd.read_excel(file_name, sheet_name=sheet, usecols=lambda c: c in wanted)
+    # Les colonnes absentes d'une ancienne version du formulaire sont ajoutées vides
+    return normalize_types(df.reindex(columns=wanted))
+
+
+def write_snapshot(df, path):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    pq.write_table(pa.Table.from_pandas(df, preserve_index=False), tmp_path)
+    # Remplacement atomique : un autre processus ne lit jamais un fichier à moitié écrit
+    os.replace(tmp_path, path)
+
+
+def read_snapshot(path):
+    return pq.read_table(path, memory_map=True).to_pandas()
+
+
+# Feuilles d'un export Kobo : le classeur n'est analysé qu'une fois par version du fichier, les lectures
+# suivantes (reconstruction du stockage, autre processus) passent par l'instantané Parquet
+def read_kobo(file_name):
+    key = snapshot_key(file_name)
+    sheets = {}
+    for sheet in SHEET_COLUMNS:
+        path = snapshot_path(key, sheet)
+        if os.path.exists(path):
+            sheets[sheet] = read_snapshot(path)
+        else:
+            sheets[sheet] = read_sheet(file_name, sheet)
+            write_snapshot(sheets[sheet], path)
+    return sheets
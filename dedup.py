@@ -0,0 +1,174 @@
+import numpy as np
+import pandas as pd
+
+from materialize import LAT, LON, OUTLET, normalize_text
+
+NAME = "Nom de l'établissement"
+PHONE = "Numéro de téléphone"
+COMMUNE = "Commune"
+
+# Cellules de la grille de blocage (degrés, environ 55 m) : seules les paires de cellules voisines sont comparées
+CELL_DEGREES = 0.0005
+EARTH_RADIUS_M = 6371000
+# Règles de rapprochement de deux points de vente
+MATCH_DISTANCE_M = 50
+NAME_THRESHOLD = 0.8
+PHONE_DISTANCE_M = 200
+# Blocs par nom ou par téléphone plus grands ignorés (nom générique, numéro de l'agent saisi partout)
+MAX_BLOCK = 50
+# Signature des noms : bigrammes de caractères hachés sur 2 x 64 bits (puissance de 2)
+SIGNATURE_BITS = 128
+SIGNATURE_CHARS = 40
+
+
+def compact_name(s):
+    return normalize_text(s).astype("string[pyarrow]").str.replace(r"\W+", "", regex=True).astype(object)
+
+
+# Numéro réduit à ses 8 derniers chiffres (indicatif, espaces et tirets ignorés) ; vide si trop court.
+# Calculé une fois par valeur distincte.
+def phone_digits(s):
+    codes, uniques = pd.factorize(s)
+    digits = pd.Series(uniques, dtype=object).astype(str).astype("string[pyarrow]") \
+        .str.replace(r"\.0$", "", regex=True).str.replace(r"\D+", "", regex=True).str[-8:]
+    digits = digits.where(digits.str.len() >= 6, "").to_numpy(dtype=object)
+    return pd.Series(np.append(digits, "")[codes], index=s.index)
+
+
+# Mélange des bits d'un entier 64 bits (finaliseur de MurmurHash3)
+def _mix(h):
+    h = h ^ (h >> np.uint64(33))
+    h = h * np.uint64(0xFF51AFD7ED558CCD)
+    h = h ^ (h >> np.uint64(33))
+    h = h * np.uint64(0xC4CEB9FE1A85EC53)
+    return h ^ (h >> np.uint64(33))
+
+
+# Signature d'un nom : un bit par bigramme de caractères (nom encadré d'espaces, tronqué à SIGNATURE_CHARS),
+# calculée sur la matrice (valeurs distinctes x positions) des bigrammes en une seule passe
+def name_signatures(names):
+    codes, uniques = pd.factorize(names)
+    width = min(max(map(len, uniques), default=0), SIGNATURE_CHARS) + 2
+    padded = np.array([f" {name[:SIGNATURE_CHARS]} " for name in uniques], dtype=f"U{width}")
+    chars = padded.view(np.uint32).reshape(len(padded), width).astype(np.uint64)
+    a, b = chars[:, :-1], chars[:, 1:]
+    bit = _mix(a << np.uint64(21) ^ b) & np.uint64(SIGNATURE_BITS - 1)
+    flag = np.where((a != 0) & (b != 0), np.uint64(1) << (bit & np.uint64(63)), np.uint64(0))
+    low = np.bitwise_or.reduce(np.where(bit < 64, flag, np.uint64(0)), axis=1)
+    high = np.bitwise_or.reduce(np.where(bit >= 64, flag, np.uint64(0)), axis=1)
+    return low[codes], high[codes]
+
+
+# Similarité de Jaccard des bigrammes, approchée par les signatures : popcount(a & b) / popcount(a | b)
+def name_similarity(low, high, i, j):
+    inter = np.bitwise_count(low[i] & low[j]) + np.bitwise_count(high[i] & high[j])
+    union = np.bitwise_count(low[i] | low[j]) + np.bitwise_count(high[i] | high[j])
+    return np.divide(inter, union, out=np.zeros(len(i)), where=union > 0)
+
+
+def haversine_m(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = map(np.radians, (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(a))
+
+
+# Paires candidates de la grille : même cellule ou cellule voisine (demi-voisinage, chaque paire une fois)
+def grid_pairs(lat, lon):
+    known = ~(np.isnan(lat) | np.isnan(lon))
+    cells = pd.DataFrame({"i": np.flatnonzero(known),
+                          "x": np.floor(lat[known] / CELL_DEGREES).astype(np.int64),
+                          "y": np.floor(lon[known] / CELL_DEGREES).astype(np.int64)})
+    pairs = []
+    for dx, dy in ((0, 0), (1, -1), (1, 0), (1, 1), (0, 1)):
+        p = cells.merge(cells.assign(x=cells["x"] + dx, y=cells["y"] + dy), on=["x", "y"], suffixes=("", "_j"))
+        pairs.append(p[p["i"] < p["i_j"]] if (dx, dy) == (0, 0) else p)
+    return pd.concat(pairs)[["i", "i_j"]]
+
+
+# Paires candidates partageant un même code (nom compact + commune, téléphone), codes vides exclus
+def key_pairs(codes, empty):
+    frame = pd.DataFrame({"i": np.arange(len(codes)), "k": codes})
+    size = np.bincount(codes)[codes]
+    frame = frame[(size > 1) & (size <= MAX_BLOCK) & ~np.isin(codes, empty)]
+    p = frame.merge(frame, on="k", suffixes=("", "_j"))
+    return p.loc[p["i"] < p["i_j"], ["i", "i_j"]]
+
+
+# Composantes connexes des paires rapprochées (graphe non orienté) ; scipy n'est importé qu'à l'intégration
+def components(n, a, b):
+    from scipy.sparse import coo_matrix
+    from scipy.sparse.csgraph import connected_components
+
+    graph = coo_matrix((np.ones(len(a), dtype=np.int8), (a, b)), shape=(n, n))
+    return connected_components(graph, directed=False)[1]
+
+
+# Une ligne par clé de base (outlet_key) : les visites répétées d'un même point de vente ne sont comparées qu'une fois.
+# Nom et commune de la première soumission, dernier téléphone renseigné, position médiane des visites.
+def outlet_candidates(pdv):
+    codes, keys = pd.factorize(pdv[OUTLET])
+    frame = pd.DataFrame({
+        "code": codes,
+        "time": pdv["_submission_time"].values,
+        "lat": pd.to_numeric(pdv[LAT], errors="coerce").values,
+        "lon": pd.to_numeric(pdv[LON], errors="coerce").values,
+    })
+    by_code = frame.groupby("code")
+    first = by_code["time"].idxmin().to_numpy()
+    phone = phone_digits(pdv[PHONE]).to_numpy(dtype=object)
+    with_phone = frame[phone != ""]
+    last = with_phone.groupby("code")["time"].idxmax()
+    phones = pd.Series(phone[last.to_numpy()], index=last.index)
+    outlets = pd.DataFrame({
+        OUTLET: np.asarray(keys, dtype=object),
+        "time": frame["time"].to_numpy()[first],
+        "lat": by_code["lat"].median().to_numpy(),
+        "lon": by_code["lon"].median().to_numpy(),
+        "phone": phones.reindex(np.arange(len(keys))).to_numpy(),
+        "name": pdv[NAME].to_numpy()[first],
+        "commune": pdv[COMMUNE].to_numpy()[first],
+    })
+    return outlets
+
+
+# Paires de points de vente rapprochés, avec distance, similarité des noms et téléphone commun
+def duplicate_pairs(outlets):
+    lat, lon = outlets["lat"].to_numpy(float), outlets["lon"].to_numpy(float)
+    name = compact_name(outlets["name"])
+    place = pd.factorize((name + "|" + normalize_text(outlets["commune"])).where(name != "", ""))
+    phone = pd.factorize(outlets["phone"].fillna(""))
+    # Numéros dans le nom (« Boutique 12 » et « Boutique 13 » sont deux points de vente)
+    number = pd.factorize(name.astype("string[pyarrow]").str.replace(r"\D+", "", regex=True).astype(object))
+    no_place, no_phone, no_number = (np.flatnonzero(uniques == "") for _, uniques in (place, phone, number))
+    pairs = pd.concat([grid_pairs(lat, lon), key_pairs(place[0], no_place), key_pairs(phone[0], no_phone)])
+    # Paire (i, j) avec i < j, trouvée une seule fois quel que soit le nombre de blocs partagés
+    i, j = pairs["i"].to_numpy(np.int64), pairs["i_j"].to_numpy(np.int64)
+    pair = np.unique(np.minimum(i, j) * len(outlets) + np.maximum(i, j))
+    i, j = pair // len(outlets), pair % len(outlets)
+
+    distance = haversine_m(lat[i], lon[i], lat[j], lon[j])
+    low, high = name_signatures(name.to_numpy(dtype=object))
+    similarity = name_similarity(low, high, i, j)
+    same_phone = (phone[0][i] == phone[0][j]) & ~np.isin(phone[0][i], no_phone)
+    same_place = (place[0][i] == place[0][j]) & ~np.isin(place[0][i], no_place)
+    numbers = number[0]
+    same_number = (numbers[i] == numbers[j]) | np.isin(numbers[i], no_number) | np.isin(numbers[j], no_number)
+    unknown = np.isnan(distance)
+    match = ((same_phone & (unknown | (distance <= PHONE_DISTANCE_M)))
+             | ((distance <= MATCH_DISTANCE_M) & (similarity >= NAME_THRESHOLD) & same_number)
+             | (unknown & same_place))
+    return pd.DataFrame({"i": i, "j": j, "distance_m": distance, "similarity": similarity,
+                         "same_phone": same_phone})[match]
+
+
+# Identifiant canonique par soumission : clé de base du point de vente le plus anciennement visité
+# parmi ses doublons rapprochés. Coût quasi linéaire : seules les paires d'un même bloc sont comparées.
+def canonical_outlets(pdv):
+    if pdv.empty:
+        return pdv[OUTLET].copy()
+    outlets = outlet_candidates(pdv)
+    pairs = duplicate_pairs(outlets)
+    labels = components(len(outlets), pairs["i"].to_numpy(), pairs["j"].to_numpy())
+    first = outlets.assign(label=labels).sort_values("time", kind="stable").drop_duplicates("label")
+    canonical = pd.Series(labels, index=outlets[OUTLET]).map(first.set_index("label")[OUTLET])
+    return pdv[OUTLET].map(canonical)
@@ -0,0 +1,140 @@
+import io
+import os
+import tempfile
+import zipfile
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+import xlsxwriter
+
+from data_loader import SHEET_COLUMNS
+from materialize import LINE_KEY, PARENT_KEY, PDV_KEY
+from sql_store import iter_table
+from stage_cache import cached, frame_key
+
+# Au-delà de ce nombre de lignes, le classeur est écrit en mode constant_memory (flux ligne par ligne)
+CONSTANT_MEMORY_ROWS = 50_000
+CHUNK_ROWS = 10_000
+
+
+# Lignes du DataFrame par blocs, valeurs manquantes en None (cellules vides dans Excel)
+def iter_rows(df, chunk_rows=CHUNK_ROWS):
+    for start in range(0, len(df), chunk_rows):
+        chunk = df.iloc[start:start + chunk_rows].astype(object)
+        yield from chunk.where(chunk.notna(), None).itertuples(index=False, name=None)
+
+
+def write_xlsx(df, target, constant_memory=False, sheet_name="Sheet1"):
+    workbook = xlsxwriter.Workbook(target, {
+        "constant_memory": constant_memory,
+        "in_memory": not constant_memory,
+        "default_date_format": "yyyy-mm-dd hh:mm:ss",
+        "remove_timezone": True,
+        "strings_to_urls": False,
+    })
+    worksheet = workbook.add_worksheet(sheet_name)
+    worksheet.write_row(0, 0, [str(c) for c in df.columns], workbook.add_format({"bold": True}))
+    for row_number, row in enumerate(iter_rows(df), start=1):
+        worksheet.write_row(row_number, 0, row)
+    workbook.close()
+
+
+def _build_excel(df):
+    if len(df) <= CONSTANT_MEMORY_ROWS:
+        output = io.BytesIO()
+        write_xlsx(df, output)
+        return output.getvalue()
+    # Mode constant_memory : xlsxwriter passe par un fichier temporaire
+    fd, path = tempfile.mkstemp(suffix=".xlsx")
+    os.close(fd)
+    try:
+        write_xlsx(df, path, constant_memory=True)
+        with open(path, "rb") as f:
+            return f.read()
+    finally:
+        os.remove(path)
+
+
+# CSV produit bloc par bloc (en-tête puis CHUNK_ROWS lignes à la fois)
+def iter_csv(df, chunk_rows=CHUNK_ROWS):
+    yield df.iloc[:0].to_csv(index=False).encode("utf-8")
+    for start in range(0, len(df), chunk_rows):
+        yield df.iloc[start:start + chunk_rows].to_csv(index=False, header=False).encode("utf-8")
+
+
+def csv_bytes(df):
+    return b"".join(iter_csv(df))
+
+
+# Parquet écrit par groupes de lignes, sans convertir tout le DataFrame en table Arrow d'un coup
+def write_parquet(df, target, chunk_rows=CHUNK_ROWS):
+    schema = pa.Schema.from_pandas(df, preserve_index=False)
+    with pq.ParquetWriter(target, schema, compression="zstd") as writer:
+        for start in range(0, len(df), chunk_rows):
+            chunk = df.iloc[start:start + chunk_rows]
+            writer.write_table(pa.Table.from_pandas(chunk, schema=schema, preserve_index=False))
+
+
+def parquet_bytes(df):
+    output = io.BytesIO()
+    write_parquet(df, output)
+    return output.getvalue()
+
+
+# Lignes de vente de la vue partagée, par blocs de CHUNK_ROWS, renommées au grain Sondage de l'export Kobo
+# (identifiant de ligne dans _index, PDV dans _parent_index) sans copier la vue entière
+def iter_lines(df, line_columns, chunk_rows=CHUNK_ROWS):
+    has_line = df["Sorte_caracteristic"].notna().to_numpy() if "Sorte_caracteristic" in df.columns else None
+    for start in range(0, max(len(df), 1), chunk_rows):
+        chunk = df.iloc[start:start + chunk_rows]
+        if has_line is not None:
+            chunk = chunk[has_line[start:start + chunk_rows]]
+        lines = chunk[line_columns]
+        lines.insert(0, PARENT_KEY, chunk[PDV_KEY].to_numpy())
+        lines.insert(0, PDV_KEY, chunk[LINE_KEY].to_numpy() if LINE_KEY in chunk.columns else None)
+        yield lines
+
+
+# Archive zip qui garde les grains séparés pour les points de vente sélectionnés :
+# pdv.csv (un PDV par ligne), gpi.csv (catégories choisies), sondage.csv (lignes de vente retenues).
+# Comme dans l'export Kobo, gpi.csv et sondage.csv donnent l'identifiant de leur ligne dans _index et le PDV
+# dans _parent_index. Les grains PDV et GPI sont lus par blocs dans la base SQLite, sans charger les tables complètes.
+def bundle_bytes(df):
+    keys = df[PDV_KEY].unique()
+    pdv_columns = [c for c in df.columns if c in SHEET_COLUMNS["Unilever"]]
+    line_columns = [c for c in df.columns if c not in pdv_columns and c != LINE_KEY]
+    grains = {
+        "pdv.csv": (chunk[pdv_columns] for chunk in iter_table("pdv", keys)),
+        "gpi.csv": iter_table("gpi", keys),
+        "sondage.csv": iter_lines(df, line_columns),
+    }
+    output = io.BytesIO()
+    with zipfile.ZipFile(output, "w", compression=zipfile.ZIP_DEFLATED) as bundle:
+        for name, chunks in grains.items():
+            with bundle.open(name, "w") as f:
+                for number, chunk in enumerate(chunks):
+                    for part, data in enumerate(iter_csv(chunk)):
+                        # En-tête écrit une seule fois, pour le premier bloc
+                        if part or not number:
+                            f.write(data)
+    return output.getvalue()
+
+
+XLSX_MIME = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+# Formats proposés au téléchargement : extension, type MIME, fonction de construction
+EXPORT_FORMATS = {
+    "Excel": ("xlsx", XLSX_MIME, _build_excel),
+    "CSV": ("csv", "text/csv", csv_bytes),
+    "Parquet": ("parquet", "application/vnd.apache.parquet", parquet_bytes),
+    "Bundle (zip)": ("zip", "application/zip", bundle_bytes),
+}
+
+
+# Fichier d'export de la sélection, construit à la demande et mis en cache par sélection et format
+def export_bytes(df, fmt="Excel", version=None):
+    return cached("export", (frame_key(df, version), fmt), lambda: EXPORT_FORMATS[fmt][2](df))
+
+
+def excel_bytes(df):
+    return export_bytes(df, "Excel")
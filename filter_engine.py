@@ -0,0 +1,89 @@
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+from ingestion import data_version, load_lines
+
+# Colonnes des filtres multiples de la barre latérale
+FILTER_COLUMNS = ["Commune", "Quartier", "Nom et prénom de l'agent",
+                  "Selectionner Parmis ces categories", "Sorte_caracteristic"]
+TIME_COLUMN = "_submission_time"
+
+
+# Index construit une fois par version des données :
+# - codes catégoriels et dictionnaire trié des valeurs pour chaque colonne filtrable
+# - liste des lignes (posting list) de chaque valeur
+# - ordre des lignes trié sur _submission_time pour les plages de dates
+# Une combinaison de filtres se résout en intersection de masques booléens, sans rebalayer les chaînes.
+class FilterIndex:
+    def __init__(self, df, columns=FILTER_COLUMNS, time_column=TIME_COLUMN):
+        self.df = df
+        self.categories = {}
+        self.codes = {}
+        self.postings = {}
+        for col in columns:
+            values = df[col]
+            if isinstance(values.dtype, pd.CategoricalDtype):
+                # Colonne déjà catégorielle (vue compacte) : seul le dictionnaire est retrié
+                cat = values.array.remove_unused_categories()
+                cat = cat.reorder_categories(sorted(cat.categories, key=str))
+            else:
+                cat = pd.Categorical(values.where(values.isna(), values.astype(str)))
+            codes = cat.codes.astype(np.int32)
+            order = np.argsort(codes, kind="stable")
+            bounds = np.searchsorted(codes[order], np.arange(len(cat.categories) + 1))
+            self.categories[col] = np.asarray(cat.categories, dtype=object)
+            self.codes[col] = codes
+            self.postings[col] = {value: order[bounds[i]:bounds[i + 1]]
+                                  for i, value in enumerate(self.categories[col])}
+
+        times = df[time_column].to_numpy(dtype="datetime64[ns]")
+        self.time_order = np.argsort(times, kind="stable")
+        self.sorted_times = times[self.time_order]
+
+    def __len__(self):
+        return len(self.df)
+
+    # Masque des lignes dont la date est dans [start, end], par recherche dichotomique
+    def date_mask(self, start, end):
+        lo = np.searchsorted(self.sorted_times, np.datetime64(start, "ns"), side="left")
+        hi = np.searchsorted(self.sorted_times, np.datetime64(end, "ns"), side="right")
+        mask = np.zeros(len(self), dtype=bool)
+        mask[self.time_order[lo:hi]] = True
+        return mask
+
+    def value_mask(self, col, selection):
+        mask = np.zeros(len(self), dtype=bool)
+        for value in selection:
+            rows = self.postings[col].get(str(value))
+            if rows is not None:
+                mask[rows] = True
+        return mask
+
+    # Valeurs triées présentes parmi les lignes du masque, lues dans le dictionnaire précalculé
+    def options(self, col, mask=None):
+        codes = self.codes[col] if mask is None else self.codes[col][mask]
+        present = np.bincount(codes[codes >= 0], minlength=len(self.categories[col])) > 0
+        return list(self.categories[col][present])
+
+    def select(self, mask, filters):
+        mask = mask.copy()
+        for col, selection in filters.items():
+            if selection:
+                mask &= self.value_mask(col, selection)
+        return mask
+
+    def filter(self, mask, filters):
+        return self.df[self.select(mask, filters)]
+
+
+@lru_cache(maxsize=4)
+def _load_filter_index(version, pdv_columns, fact_columns):
+    return FilterIndex(load_lines(pdv_columns, fact_columns, version))
+
+
+# Index de filtrage de la vue au grain ligne de vente, partagé entre les sessions. version : celle lue une fois
+# en début de relance, pour que tous les étages de la relance portent sur les mêmes données
+def load_filter_index(pdv_columns, fact_columns, version=None):
+    return _load_filter_index(data_version() if version is None else version, tuple(pdv_columns), tuple(fact_columns))
@@ -0,0 +1,105 @@
+import numpy as np
+import pandas as pd
+
+from materialize import OUTLET, PDV_KEY, TOTAL_PRICE
+
+DAY = "jour"
+VISITS = "visites"
+SALES = "ventes"
+
+# Fenêtres de comptage des visites (jours) et seuil de récence de la carte
+WINDOWS = (30, 90)
+RECENT_DAYS = 30
+LAST_VISIT, FIRST_VISIT = "derniere_visite", "premiere_visite"
+DAYS_SINCE = "jours_depuis_visite"
+COLOR = "couleur_recence"
+
+# Attributs d'un point de vente, repris de sa soumission la plus récente
+OUTLET_ATTRIBUTES = [PDV_KEY, "_submission_time", "Nom de l'établissement", "Nom et prénom de l'agent", "Propriètaire",
+                     "Type du PDV", "Commune", "Quartier", "Adresse du PDV", "Numéro de téléphone",
+                     "_Prendre les coordonnées du point de vente_latitude",
+                     "_Prendre les coordonnées du point de vente_longitude"]
+
+
+def window_column(days):
+    return f"visites_{days}j"
+
+
+# Contributions (point de vente x jour) des soumissions : une visite par soumission et ses ventes
+def visit_contributions(pdv, facts, keys=None):
+    if keys is not None:
+        pdv = pdv[pdv[PDV_KEY].isin(keys)]
+        facts = facts[facts[PDV_KEY].isin(keys)]
+    sales = pd.to_numeric(facts[TOTAL_PRICE], errors="coerce").groupby(facts[PDV_KEY]).sum()
+    visits = pd.DataFrame({
+        OUTLET: pdv[OUTLET].values,
+        DAY: pdv["_submission_time"].dt.floor("D").values,
+        VISITS: 1,
+        SALES: pdv[PDV_KEY].map(sales).fillna(0).values,
+    })
+    return visits.groupby([OUTLET, DAY], sort=False)[[VISITS, SALES]].sum().reset_index()
+
+
+def _compact(visits):
+    visits = visits.groupby([OUTLET, DAY], sort=False)[[VISITS, SALES]].sum().reset_index()
+    return visits[visits[VISITS] != 0].sort_values([OUTLET, DAY], ignore_index=True)
+
+
+def build_visits(pdv, facts):
+    return _compact(visit_contributions(pdv, facts))
+
+
+# Mise à jour incrémentale, comme pour le cube : retrait des anciennes contributions des soumissions
+# modifiées, ajout des nouvelles, sans repasser sur les autres visites
+def update_visits(visits, old_pdv, old_facts, pdv, facts, keys):
+    removed = visit_contributions(old_pdv, old_facts, keys)
+    removed[[VISITS, SALES]] = -removed[[VISITS, SALES]]
+    return _compact(pd.concat([visits, removed, visit_contributions(pdv, facts, keys)], ignore_index=True))
+
+
+def _latest(pdv):
+    columns = [OUTLET] + [c for c in OUTLET_ATTRIBUTES if c in pdv.columns]
+    return pdv[columns].sort_values("_submission_time", kind="stable").drop_duplicates(OUTLET, keep="last")
+
+
+def build_outlets(pdv):
+    return _latest(pdv).sort_values(OUTLET, ignore_index=True)
+
+
+# Seuls les points de vente des soumissions touchées (avant et après modification) sont recalculés
+def update_outlets(outlets, old_pdv, pdv, keys):
+    touched = pd.concat([old_pdv.loc[old_pdv[PDV_KEY].isin(keys), OUTLET], pdv.loc[pdv[PDV_KEY].isin(keys), OUTLET]])
+    touched = touched.unique()
+    refreshed = _latest(pdv[pdv[OUTLET].isin(touched)])
+    kept = outlets[~outlets[OUTLET].isin(touched)]
+    return pd.concat([kept, refreshed], ignore_index=True).sort_values(OUTLET, ignore_index=True)
+
+
+# Table fréquence / récence / montant : une ligne par point de vente, calculée sur la table
+# (point de vente x jour) et non sur les soumissions ; la récence est relative à `today`
+def recency_table(visits, outlets, today, windows=WINDOWS, recent_days=RECENT_DAYS):
+    today = pd.Timestamp(today).normalize()
+    by_outlet = visits.groupby(OUTLET, sort=False)
+    table = pd.DataFrame({
+        FIRST_VISIT: by_outlet[DAY].min(),
+        LAST_VISIT: by_outlet[DAY].max(),
+        VISITS: by_outlet[VISITS].sum(),
+        SALES: by_outlet[SALES].sum(),
+    })
+    age = (today - visits[DAY]).dt.days.to_numpy()
+    for days in windows:
+        table[window_column(days)] = visits[VISITS].where((age >= 0) & (age < days), 0).groupby(visits[OUTLET]).sum()
+    table[DAYS_SINCE] = (today - table[LAST_VISIT]).dt.days
+    table[COLOR] = np.where(table[DAYS_SINCE] <= recent_days, "green", "red")
+    return outlets.merge(table, left_on=OUTLET, right_index=True, how="inner")
+
+
+# Récence des marqueurs de la carte : recherche par point de vente canonique (outlet_ids : _index -> identifiant),
+# O(marqueurs)
+def with_recency(df, recency, outlet_ids):
+    keys = df[PDV_KEY].map(outlet_ids)
+    columns = [LAST_VISIT, VISITS, window_column(RECENT_DAYS), SALES, DAYS_SINCE, COLOR]
+    matched = recency.set_index(OUTLET)[columns].reindex(keys.to_numpy())
+    matched.index = df.index
+    matched[COLOR] = matched[COLOR].fillna("red")
+    return pd.concat([df, matched], axis=1)
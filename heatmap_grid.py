@@ -0,0 +1,70 @@
+import hashlib
+
+import numpy as np
+
+from stage_cache import cached
+
+# Niveaux de zoom candidats et budget de points envoyés au navigateur
+HEAT_ZOOMS = (4, 6, 8, 10, 12, 14)
+MAX_HEAT_POINTS = 3000
+# Taille d'une cellule, en pixels à l'écran au niveau de zoom correspondant
+PIXELS_PER_CELL = 8
+
+_CELL_OFFSET = 1 << 31
+
+
+# Taille de cellule (degrés) : une tuile de 256 px couvre 360 / 2**zoom degrés de longitude
+def cell_size(zoom):
+    return 360 / (256 * 2 ** zoom) * PIXELS_PER_CELL
+
+
+def _cells(lats, lons, size):
+    rows = np.floor(lats / size).astype(np.int64) + _CELL_OFFSET
+    cols = np.floor(lons / size).astype(np.int64) + _CELL_OFFSET
+    return (rows << 32) | cols
+
+
+# Agrégation des points en cellules : centroïde des points de la cellule et poids cumulé
+def bin_points(lats, lons, weights, size):
+    _, inverse = np.unique(_cells(lats, lons, size), return_inverse=True)
+    counts = np.bincount(inverse)
+    return np.column_stack([
+        np.bincount(inverse, lats) / counts,
+        np.bincount(inverse, lons) / counts,
+        np.bincount(inverse, weights),
+    ])
+
+
+# Grille de densité du zoom le plus fin qui tient dans le budget, intensités ramenées à [0, 1] pour HeatMap.
+# Le nombre de cellules croît avec le zoom : recherche dichotomique sur le seul comptage des cellules,
+# puis agrégation de la grille retenue uniquement.
+def heat_grid(lats, lons, weights=None, zooms=HEAT_ZOOMS, max_points=MAX_HEAT_POINTS):
+    lats = np.asarray(lats, dtype=np.float64)
+    lons = np.asarray(lons, dtype=np.float64)
+    if len(lats) == 0:
+        return []
+    if weights is None:
+        weights = np.ones(len(lats))
+    weights = np.nan_to_num(np.asarray(weights, dtype=np.float64)).clip(min=0)
+    if not weights.any():
+        weights = np.ones(len(lats))
+    zooms = sorted(zooms)
+    lo, hi = 0, len(zooms) - 1
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if len(np.unique(_cells(lats, lons, cell_size(zooms[mid])))) <= max_points:
+            lo = mid
+        else:
+            hi = mid - 1
+    level = bin_points(lats, lons, weights, cell_size(zooms[lo]))
+    return np.column_stack([level[:, 0], level[:, 1], level[:, 2] / level[:, 2].max()]).tolist()
+
+
+# Points pondérés de la heatmap, mis en cache par sélection (coordonnées et poids identiques)
+def heat_points(lats, lons, weights=None, max_points=MAX_HEAT_POINTS):
+    arrays = [np.asarray(a, dtype=np.float64) for a in (lats, lons) + (() if weights is None else (weights,))]
+    digest = hashlib.sha1()
+    for a in arrays:
+        digest.update(a.tobytes())
+    key = (digest.hexdigest(), len(arrays), max_points)
+    return cached("heat_points", key, lambda: heat_grid(*arrays, max_points=max_points))
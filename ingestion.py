@@ -0,0 +1,342 @@
+import fnmatch
+import glob
+import json
+import os
+import re
+import time
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+from filelock import FileLock, Timeout
+
+from compaction import compact_frame, update_categories
+from data_loader import DATETIME_COLUMNS, NUMERIC_COLUMNS, SHEET_COLUMNS, read_kobo, read_snapshot, write_snapshot
+from dedup import canonical_outlets
+from frequency import build_outlets, build_visits, recency_table, update_outlets, update_visits
+from materialize import LINE_KEY, OUTLET, PARENT_KEY, build_tables
+from rollups import build_cube, update_cube
+from sql_store import sync_tables
+
+# Dossier de dépôt des exports Kobo et motif des fichiers à intégrer
+DROP_DIR = os.environ.get("KOBO_DROP_DIR", ".")
+EXPORT_PATTERN = "Unilever_-_all_versions_-_labels_-*.xlsx"
+# Horodatage que Kobo inscrit dans le nom de l'export (…_-_2024-11-28-12-22-34.xlsx)
+EXPORT_STAMP = re.compile(r"(\d{4}-\d{2}-\d{2}-\d{2}-\d{2}-\d{2})\.xlsx$")
+
+# Stockage persistant : une table Parquet par feuille + un manifeste des exports déjà intégrés
+STORE_DIR = os.environ.get("KOBO_STORE_DIR", ".kobo_store")
+MANIFEST = os.path.join(STORE_DIR, "manifest.json")
+# Registre des catégories des colonnes texte peu variées (codes stables d'une version à l'autre)
+CATEGORIES = os.path.join(STORE_DIR, "categories.json")
+
+KEY = "_index"
+HASH_COLUMN = "_row_hash"
+
+# Format des tables dérivées (pdv, facts, cube, base SQLite) : à incrémenter quand elles changent
+STORE_FORMAT = 8
+# Empreinte du stockage : si elle change, le stockage est reconstruit depuis les exports
+SCHEMA = repr((STORE_FORMAT, sorted(SHEET_COLUMNS.items())))
+
+
+def store_path(sheet):
+    return os.path.join(STORE_DIR, f"{sheet}.parquet")
+
+
+def read_manifest():
+    if not os.path.exists(MANIFEST):
+        return {"version": 0, "schema": SCHEMA, "exports": {}}
+    with open(MANIFEST, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def write_json(data, path):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def write_manifest(manifest):
+    write_json(manifest, MANIFEST)
+
+
+def read_categories():
+    if not os.path.exists(CATEGORIES):
+        return {}
+    with open(CATEGORIES, encoding="utf-8") as f:
+        return json.load(f)
+
+
+# Version courante des données : incrémentée à chaque intégration qui modifie le stockage
+def data_version():
+    return read_manifest()["version"]
+
+
+def export_signature(path):
+    stat = os.stat(path)
+    return f"{stat.st_size}:{stat.st_mtime_ns}"
+
+
+# Date d'un export : celle de son nom de fichier, à défaut sa date de modification. Recopier un ancien export
+# dans le dossier de dépôt ne le fait donc pas passer pour le plus récent.
+def export_stamp(path):
+    match = EXPORT_STAMP.search(os.path.basename(path))
+    if match:
+        return match.group(1)
+    return time.strftime("%Y-%m-%d-%H-%M-%S", time.localtime(os.path.getmtime(path)))
+
+
+# Exports présents dans le dossier de dépôt, du plus ancien au plus récent
+def list_exports():
+    return sorted(glob.glob(os.path.join(DROP_DIR, EXPORT_PATTERN)), key=lambda path: (export_stamp(path), path))
+
+
+def pending_exports(manifest):
+    return [path for path in list_exports()
+            if manifest["exports"].get(os.path.basename(path)) != export_signature(path)]
+
+
+def read_store_sheet(sheet):
+    path = store_path(sheet)
+    if os.path.exists(path):
+        return read_snapshot(path)
+    return None
+
+
+# Empreinte de chaque ligne, indépendante des types déduits par read_excel : une cellule vide fait passer une
+# colonne d'entiers en flottants, une colonne texte entièrement vide est lue comme numérique
+def row_hashes(df):
+    canonical = {}
+    for col in df.columns:
+        s = df[col]
+        if col in NUMERIC_COLUMNS:
+            canonical[col] = s.astype("float64")
+        elif col in DATETIME_COLUMNS:
+            canonical[col] = pd.Series(pd.to_datetime(s).to_numpy("datetime64[ns]").view(np.int64), index=s.index)
+        else:
+            canonical[col] = s.astype(object).where(s.notna(), None)
+    return pd.util.hash_pandas_object(pd.DataFrame(canonical, index=df.index), index=False).values
+
+
+# Fusion d'un export complet dans la table stockée : seules les soumissions nouvelles (_index inconnu)
+# ou modifiées (empreinte de ligne différente, _submission_time compris) sont ajoutées ou remplacées, celles
+# absentes de l'export (supprimées dans Kobo) sont retirées. Renvoie la table, les lignes ajoutées ou
+# modifiées, les lignes retirées et les nombres d'ajouts et de modifications.
+def upsert(stored, incoming):
+    incoming = incoming.drop_duplicates(KEY, keep="last").copy()
+    incoming[HASH_COLUMN] = row_hashes(incoming)
+    if stored is None or stored.empty:
+        return incoming.sort_values(KEY, ignore_index=True), incoming, incoming.iloc[:0], len(incoming), 0
+
+    old_hash = pd.Series(stored[HASH_COLUMN].values, index=stored[KEY].values)
+    known = incoming[KEY].isin(old_hash.index).values
+    changed = known & (old_hash.reindex(incoming[KEY].values).values != incoming[HASH_COLUMN].values)
+    delta = incoming[~known | changed]
+    kept = stored[KEY].isin(incoming[KEY])
+    removed = stored[~kept]
+    if delta.empty and removed.empty:
+        return stored, delta, removed, 0, 0
+
+    merged = pd.concat([stored[kept & ~stored[KEY].isin(delta[KEY])], delta], ignore_index=True)
+    return merged.sort_values(KEY, ignore_index=True), delta, removed, int((~known).sum()), int(changed.sum())
+
+
+# Intègre les exports nouveaux ou modifiés du dossier de dépôt et renvoie la version du stockage.
+# Avec wait=False (tableaux de bord), rend aussitôt la version courante si un autre processus intègre déjà :
+# les sessions ne se figent pas pendant l'intégration, laissée au processus de surveillance.
+def ingest_new_exports(wait=True):
+    manifest = read_manifest()
+    if manifest.get("schema") == SCHEMA and not pending_exports(manifest):
+        return manifest["version"]
+    os.makedirs(STORE_DIR, exist_ok=True)
+    try:
+        with FileLock(os.path.join(STORE_DIR, "store.lock"), timeout=-1 if wait else 0):
+            return _ingest()
+    except Timeout:
+        return data_version()
+
+
+def _ingest():
+    manifest = read_manifest()
+    rebuild = manifest.get("schema") != SCHEMA
+    interrupted = manifest.get("interrupted", False)
+    if rebuild:
+        manifest["schema"] = SCHEMA
+        manifest["exports"] = {}
+        manifest["latest"] = ""
+    pending = pending_exports(manifest)
+    if not pending:
+        return manifest["version"]
+
+    # Chaque export Kobo contient toutes les soumissions : seul le plus récent est lu et fait foi. Un export
+    # antérieur au dernier intégré (ancien fichier recopié) est seulement enregistré.
+    latest = pending[-1]
+    for path in pending:
+        manifest["exports"][os.path.basename(path)] = export_signature(path)
+    if export_stamp(latest) < manifest.get("latest", ""):
+        print(f"{os.path.basename(latest)} : antérieur au dernier export intégré, ignoré")
+        write_manifest(manifest)
+        return manifest["version"]
+    manifest["latest"] = export_stamp(latest)
+
+    store = {sheet: None if rebuild else read_store_sheet(sheet) for sheet in SHEET_COLUMNS}
+    dirty = set()
+    # PDV dont les lignes de vente ou les attributs ont pu changer (mise à jour incrémentale du cube)
+    touched = []
+    sheets = read_kobo(latest)
+    for sheet in SHEET_COLUMNS:
+        previous = store[sheet]
+        store[sheet], delta, removed, added, changed = upsert(previous, sheets[sheet])
+        if len(delta) or len(removed):
+            dirty.add(sheet)
+            if sheet == "Unilever":
+                touched += [delta[KEY], removed[KEY]]
+            else:
+                touched += [delta[PARENT_KEY], removed[PARENT_KEY]]
+                if previous is not None:
+                    # Une ligne modifiée a pu changer de PDV : l'ancien parent est aussi concerné
+                    touched.append(previous.loc[previous[KEY].isin(delta[KEY]), PARENT_KEY])
+        print(f"{os.path.basename(latest)} [{sheet}] : {added} ajoutées, {changed} modifiées, {len(removed)} supprimées")
+
+    if interrupted:
+        dirty = set(SHEET_COLUMNS)
+    if dirty:
+        # Intégration en cours signalée dans le manifeste publié : si elle est interrompue, la suivante relit
+        # le même export et reconstruit entièrement les tables dérivées, éventuellement écrites à moitié
+        write_manifest({**read_manifest(), "interrupted": True})
+        # Jointure matérialisée une fois par version des données
+        old_pdv, old_facts, cube = read_store_sheet("pdv"), read_store_sheet("facts"), read_store_sheet("cube")
+        pdv, facts = build_tables(store)
+        # Enregistrements multiples d'une même boutique : identifiant de point de vente canonique
+        pdv[OUTLET] = canonical_outlets(pdv)
+        write_snapshot(pdv, store_path("pdv"))
+        write_snapshot(facts, store_path("facts"))
+        # Cube de cumuls journaliers et base SQLite, mis à jour uniquement pour les PDV touchés
+        full = rebuild or interrupted or cube is None or old_pdv is None or old_facts is None
+        if not full:
+            # Soumissions rattachées à un autre point de vente canonique (doublons fusionnés ou séparés)
+            previous = pdv[KEY].map(old_pdv.set_index(KEY)[OUTLET])
+            touched.append(pdv.loc[previous.ne(pdv[OUTLET]), KEY])
+        keys = None if full else pd.concat(touched).dropna().unique()
+        cube = build_cube(pdv, facts) if full else update_cube(cube, old_pdv, old_facts, pdv, facts, keys)
+        write_snapshot(cube, store_path("cube"))
+        # Visites (point de vente x jour) et attributs des points de vente, mêmes règles incrémentales
+        visits, outlets = read_store_sheet("visits"), read_store_sheet("outlets")
+        if full or visits is None or outlets is None:
+            visits, outlets = build_visits(pdv, facts), build_outlets(pdv)
+        else:
+            visits = update_visits(visits, old_pdv, old_facts, pdv, facts, keys)
+            outlets = update_outlets(outlets, old_pdv, pdv, keys)
+        write_snapshot(visits, store_path("visits"))
+        write_snapshot(outlets, store_path("outlets"))
+        sync_tables({"pdv": pdv, "facts": facts, "gpi": store["GPI"]}, keys)
+        write_json(update_categories({} if rebuild else read_categories(), [pdv, facts]), CATEGORIES)
+        # Feuilles brutes écrites en dernier : tant qu'elles ne le sont pas, l'export reste à intégrer
+        for sheet in dirty:
+            write_snapshot(store[sheet], store_path(sheet))
+        manifest["version"] += 1
+    manifest.pop("interrupted", None)
+    write_manifest(manifest)
+    return manifest["version"]
+
+
+@lru_cache(maxsize=2)
+def _load_tables(version):
+    pdv, facts = read_store_sheet("pdv"), read_store_sheet("facts")
+    if pdv is None or facts is None:
+        return pd.DataFrame(columns=SHEET_COLUMNS["Unilever"]), pd.DataFrame(columns=[KEY])
+    return pdv, facts
+
+
+# Tables matérialisées (dimension PDV, faits au grain ligne de Sondage) de la version courante
+def load_tables(version=None):
+    return _load_tables(data_version() if version is None else version)
+
+
+@lru_cache(maxsize=4)
+def _load_lines(version, pdv_columns, fact_columns):
+    pdv, facts = _load_tables(version)
+    # L'identifiant de ligne de Sondage accompagne toujours la vue (export par grain)
+    fact_columns = list(fact_columns) + [c for c in [LINE_KEY] if c in facts.columns and c not in fact_columns]
+    lines = pd.merge(pdv[list(pdv_columns)], facts[fact_columns], on=KEY, how="left", validate="one_to_many")
+    return compact_frame(lines, read_categories())
+
+
+# Vue au grain ligne de vente : chaque ligne de Sondage reçoit les attributs de son PDV,
+# un PDV sans ligne de vente apparaît une fois. Calculée une fois par version et par jeu de colonnes,
+# avec des types compacts (catégories, nombres réduits) : ne pas modifier en place.
+def load_lines(pdv_columns, fact_columns, version=None):
+    version = data_version() if version is None else version
+    return _load_lines(version, tuple(pdv_columns), tuple(dict.fromkeys(fact_columns)))[0]
+
+
+# Gain mémoire colonne par colonne de la vue compacte (affiché dans le panneau de profilage)
+def lines_memory_report(pdv_columns, fact_columns, version=None):
+    version = data_version() if version is None else version
+    return _load_lines(version, tuple(pdv_columns), tuple(dict.fromkeys(fact_columns)))[1]
+
+
+@lru_cache(maxsize=2)
+def _load_cube(version):
+    return read_store_sheet("cube")
+
+
+# Cube de cumuls (jour x agent x commune x produit) de la version courante
+def load_cube(version=None):
+    return _load_cube(data_version() if version is None else version)
+
+
+@lru_cache(maxsize=2)
+def _load_recency(version, today):
+    visits, outlets = read_store_sheet("visits"), read_store_sheet("outlets")
+    if visits is None or outlets is None:
+        return None
+    return recency_table(visits, outlets, today)
+
+
+# Table fréquence / récence / montant par point de vente, pour la version courante et le jour donné
+def load_recency(today=None, version=None):
+    return _load_recency(data_version() if version is None else version,
+                         pd.Timestamp.today().normalize() if today is None else pd.Timestamp(today))
+
+
+@lru_cache(maxsize=2)
+def _load_outlet_ids(version):
+    pdv = _load_tables(version)[0]
+    return pdv.set_index(KEY)[OUTLET] if OUTLET in pdv.columns else pd.Series(dtype=object)
+
+
+# Point de vente canonique de chaque soumission (_index -> identifiant), pour la version courante
+def load_outlet_ids(version=None):
+    return _load_outlet_ids(data_version() if version is None else version)
+
+
+# Surveillance continue du dossier de dépôt (python ingestion.py)
+def watch(interval=5):
+    from watchdog.events import FileSystemEventHandler
+    from watchdog.observers import Observer
+
+    class ExportHandler(FileSystemEventHandler):
+        def on_any_event(self, event):
+            if not event.is_directory and fnmatch.fnmatch(os.path.basename(event.src_path), EXPORT_PATTERN):
+                try:
+                    ingest_new_exports()
+                except Exception as e:
+                    # Fichier encore en cours de copie : il sera repris au prochain événement
+                    print(f"Intégration impossible pour {event.src_path} : {e}")
+
+    ingest_new_exports()
+    observer = Observer()
+    observer.schedule(ExportHandler(), DROP_DIR, recursive=False)
+    observer.start()
+    try:
+        while True:
+            time.sleep(interval)
+    finally:
+        observer.stop()
+        observer.join()
+
+
+if __name__ == "__main__":
+    watch()
@@ -0,0 +1,124 @@
+import html
+import json
+
+import folium
+import pandas as pd
+from folium.plugins import Draw, FastMarkerCluster, Fullscreen, HeatMap
+
+from heatmap_grid import heat_points
+from materialize import LAT, LON, with_coordinates
+from route_planner import ORDER
+
+# Lien d'itinéraire Google Maps vers le point de vente, depuis la position actuelle de l'appareil
+DIRECTIONS_URL = "https://www.google.com/maps/dir/?api=1&destination={lat},{lon}&travelmode=driving"
+
+# Modèle de popup partagé par tous les marqueurs, rempli dans le navigateur.
+# Chaque ligne de données vaut [lat, lon, couleur, titre, infobulle, valeur 1, valeur 2, ...].
+MARKER_CALLBACK = """function (row) {
+    var labels = %(labels)s;
+    var esc = function (v) {
+        return String(v).replace(/[&<>"']/g, function (c) { return '&#' + c.charCodeAt(0) + ';'; });
+    };
+    var body = '';
+    for (var i = 0; i < labels.length; i++) {
+        body += '<b>' + labels[i] + ' :</b> ' + esc(row[5 + i]) + '<br>';
+    }
+    if (%(directions)s) {
+        var url = %(directions_url)s.replace('{lat}', row[0]).replace('{lon}', row[1]);
+        body += '<b>Voir sur la carte :</b> <a href="' + url + '" target="_blank">'
+              + 'Cliquer ici pour obtenir l\\'itinéraire vers ce point de vente</a>';
+    }
+    var popup = '<h3>' + %(title)s + ' ' + esc(row[3]) + '</h3>'
+              + '<div style="color:' + row[2] + '; font-size:14px;">' + body + '</div>';
+    var icon = L.AwesomeMarkers.icon({
+        markerColor: row[2] === 'green' ? 'green' : 'red', icon: 'fa-dollar-sign', prefix: 'fa'
+    });
+    var marker = L.marker(new L.LatLng(row[0], row[1]), {icon: icon});
+    marker.bindTooltip(esc(row[4]));
+    marker.bindPopup(popup, {maxWidth: 600});
+    return marker;
+}"""
+
+
+# Colonne prête à être sérialisée en JSON : dates en texte, valeurs manquantes en chaîne vide
+def _json_column(s):
+    if pd.api.types.is_datetime64_any_dtype(s):
+        s = s.dt.strftime("%Y-%m-%d %H:%M:%S")
+    return s.astype(object).where(s.notna(), "")
+
+
+# Données des marqueurs construites en une passe vectorisée sur les colonnes
+def marker_payload(df, title_column, tooltip_column, fields, color_column=None):
+    columns = {
+        "lat": df[LAT],
+        "lon": df[LON],
+        "color": df[color_column] if color_column else pd.Series("gray", index=df.index),
+        "title": _json_column(df[title_column]),
+        "tooltip": _json_column(df[tooltip_column]),
+    }
+    for i, (_, col) in enumerate(fields):
+        columns[i] = _json_column(df[col])
+    return pd.DataFrame(columns).to_numpy(dtype=object).tolist()
+
+
+# Zone géographique active (formes dessinées, cercles autour d'un point) superposée à la carte
+def add_zone(m, shapes):
+    for feature in shapes:
+        geometry = feature.get("geometry") or {}
+        radius = (feature.get("properties") or {}).get("radius")
+        if geometry.get("type") == "Point" and radius:
+            lon, lat = geometry["coordinates"]
+            folium.Circle(location=[lat, lon], radius=radius, color="#002B50", fill=False).add_to(m)
+        elif geometry.get("type") in ("Polygon", "MultiPolygon"):
+            folium.GeoJson(feature, style_function=lambda _: {"color": "#002B50", "fill": False}).add_to(m)
+
+
+# Carte des points de vente : une seule couche FastMarkerCluster avec popup partagé + heatmap pré-agrégée.
+# fields : liste de (libellé, colonne) affichés dans le popup ; heat_weight_column pondère la heatmap.
+# Renvoie None sans coordonnées.
+def build_map(df, title, title_column, tooltip_column, fields, directions=False, color_column=None, zoom_start=4,
+              shapes=None, heat_weight_column=None):
+    points = with_coordinates(df)
+    if points.empty:
+        return None
+
+    m = folium.Map(location=[points[LAT].mean(), points[LON].mean()], zoom_start=zoom_start)
+    callback = MARKER_CALLBACK % {
+        "labels": json.dumps([label for label, _ in fields], ensure_ascii=False),
+        "directions": "true" if directions else "false",
+        "directions_url": json.dumps(DIRECTIONS_URL),
+        "title": json.dumps(title, ensure_ascii=False),
+    }
+    FastMarkerCluster(marker_payload(points, title_column, tooltip_column, fields, color_column),
+                      callback=callback).add_to(m)
+    # Quelques milliers de cellules pondérées au plus, quel que soit le nombre de points
+    weights = points[heat_weight_column] if heat_weight_column else None
+    HeatMap(heat_points(points[LAT], points[LON], weights)).add_to(m)
+    if shapes:
+        add_zone(m, shapes)
+    Fullscreen(position='topright').add_to(m)
+    Draw(export=True).add_to(m)
+    return m
+
+
+# Tournée planifiée : tracé départ -> points de vente (-> retour) et marqueurs numérotés dans l'ordre de passage
+def route_map(route, start_lat, start_lon, label_column, return_to_start=False, zoom_start=13):
+    m = folium.Map(location=[start_lat, start_lon], zoom_start=zoom_start)
+    path = [(start_lat, start_lon)] + list(zip(route[LAT], route[LON]))
+    if return_to_start:
+        path.append((start_lat, start_lon))
+    folium.PolyLine(path, weight=3, color="blue").add_to(m)
+    folium.Marker([start_lat, start_lon], tooltip="Départ", icon=folium.Icon(color="green", icon="home")).add_to(m)
+    labels = _json_column(route[label_column]) if label_column in route.columns else pd.Series("", index=route.index)
+    for order, lat, lon, label in zip(route[ORDER], route[LAT], route[LON], labels):
+        folium.Marker(
+            [lat, lon],
+            tooltip=f"{order}. {html.escape(str(label))}",
+            icon=folium.DivIcon(html=f'<div style="background:#002B50;color:white;border-radius:50%;width:22px;'
+                                     f'height:22px;text-align:center;font-size:11px;line-height:22px;">{order}</div>'),
+        ).add_to(m)
+    if len(route):
+        lats, lons = zip(*path)
+        m.fit_bounds([[min(lats), min(lons)], [max(lats), max(lons)]])
+    Fullscreen(position='topright').add_to(m)
+    return m
@@ -0,0 +1,94 @@
+import numpy as np
+import pandas as pd
+
+from data_loader import SHEET_COLUMNS
+
+# Clés de jointure Kobo : les feuilles répétées (GPI, Sondage) pointent vers la soumission via _parent_index
+PDV_KEY = "_index"
+PARENT_KEY = "_parent_index"
+# Identifiant d'une ligne de Sondage (son _index dans la feuille), conservé dans les faits
+LINE_KEY = "_line_index"
+
+CATEGORY = "Selectionner Parmis ces categories"
+PRODUCT_CHOICE = "choisissez parmis ces sortes…."
+PRODUCT = "Sorte_caracteristic"
+QUANTITY = "Quantite totale de ${Sorte_caracteristic}"
+TOTAL_PRICE = "Prix de vente total de ${Sorte_caracteristic}"
+
+# Coordonnées GPS des points de vente
+LAT = "_Prendre les coordonnées du point de vente_latitude"
+LON = "_Prendre les coordonnées du point de vente_longitude"
+
+# Identité d'un point de vente physique (plusieurs soumissions = plusieurs visites du même PDV)
+OUTLET = "_outlet"
+OUTLET_COLUMNS = ["Nom de l'établissement", "Quartier", "Commune"]
+
+
+# "Vaseline PJs 95ml" (GPI) et "Vaseline_PJs_95ml" (Sondage) désignent le même produit
+def normalize_product(s):
+    return s.astype(str).str.strip().str.replace(" ", "_", regex=False)
+
+
+# Texte normalisé (minuscules, espaces réduits), calculé une fois par valeur distincte ; vide si manquant
+def normalize_text(s):
+    codes, uniques = pd.factorize(s)
+    text = pd.Series(uniques, dtype=object).astype(str).astype("string[pyarrow]").str.lower().str.strip() \
+        .str.replace(r"\s+", " ", regex=True)
+    return pd.Series(np.append(text.to_numpy(dtype=object), "")[codes], index=s.index)
+
+
+# Clé d'un point de vente : nom, quartier et commune normalisés (casse, espaces) ; une soumission
+# sans nom d'établissement reste un point de vente à part entière
+def outlet_key(df):
+    name = normalize_text(df[OUTLET_COLUMNS[0]])
+    key = name
+    for col in OUTLET_COLUMNS[1:]:
+        key = key + "|" + normalize_text(df[col])
+    return key.where(name != "", "#" + df[PDV_KEY].astype(str))
+
+
+# Jointure matérialisée, calculée une fois par version des données :
+# - pdv   : dimension point de vente, une ligne par _index
+# - facts : une ligne par ligne de Sondage, avec sa catégorie GPI, sans produit cartésien GPI x Sondage
+def build_tables(sheets):
+    pdv = sheets["Unilever"].drop_duplicates(PDV_KEY, keep="last").reset_index(drop=True)
+    pdv[OUTLET] = outlet_key(pdv)
+
+    gpi = sheets["GPI"].dropna(subset=[PARENT_KEY])
+    categories = pd.DataFrame({
+        PDV_KEY: gpi[PARENT_KEY].astype(pdv[PDV_KEY].dtype),
+        "_product": normalize_product(gpi[PRODUCT_CHOICE]),
+        CATEGORY: gpi[CATEGORY],
+    }).drop_duplicates([PDV_KEY, "_product"])
+    # Catégorie d'un PDV qui n'en a sélectionné qu'une, utilisée quand le produit n'est pas retrouvé dans GPI
+    by_pdv = categories.groupby(PDV_KEY)[CATEGORY]
+    single_category = by_pdv.first()[by_pdv.nunique() == 1]
+
+    sondage = sheets["Sondage"].dropna(subset=[PARENT_KEY])
+    facts = sondage.rename(columns={PDV_KEY: LINE_KEY, PARENT_KEY: PDV_KEY})
+    facts[PDV_KEY] = facts[PDV_KEY].astype(pdv[PDV_KEY].dtype)
+    # Lignes orphelines (soumission supprimée côté Kobo) écartées
+    facts = facts[facts[PDV_KEY].isin(pdv[PDV_KEY])]
+    facts["_product"] = normalize_product(facts[PRODUCT])
+    facts = facts.merge(categories, on=[PDV_KEY, "_product"], how="left", validate="many_to_one")
+    facts[CATEGORY] = facts[CATEGORY].fillna(facts[PDV_KEY].map(single_category))
+    facts = facts.drop(columns="_product")
+    facts = facts[[PDV_KEY, CATEGORY] + [c for c in facts.columns if c not in (PDV_KEY, CATEGORY)]]
+    return pdv, facts.reset_index(drop=True)
+
+
+# Vue au grain PDV d'une sélection au grain ligne de vente : un marqueur par point de vente,
+# produits listés et quantités / montants additionnés
+def pdv_view(df):
+    dims = df[[c for c in df.columns if c in SHEET_COLUMNS["Unilever"]]].drop_duplicates(PDV_KEY)
+    agg = {PRODUCT: lambda s: ", ".join(s.dropna().astype(str).unique())}
+    for col in (QUANTITY, TOTAL_PRICE):
+        if col in df.columns:
+            agg[col] = "sum"
+    lines = df.groupby(PDV_KEY, sort=False).agg(agg)
+    return dims.merge(lines, left_on=PDV_KEY, right_index=True, how="left")
+
+
+# Lignes disposant de coordonnées, sélectionnées avec un seul masque
+def with_coordinates(df):
+    return df[df[LAT].notna() & df[LON].notna()]
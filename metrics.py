@@ -0,0 +1,86 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from prometheus_client import Counter, Gauge, Histogram, start_http_server
+
+# Port de l'endpoint Prometheus (/metrics) ; 0 pour le désactiver
+METRICS_PORT = int(os.environ.get("METRICS_PORT", "9108"))
+
+STAGE_SECONDS = Histogram("dashboard_stage_seconds", "Durée d'un étage du script, par relance", ["stage"],
+                          buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60))
+STAGE_ROWS = Gauge("dashboard_stage_rows", "Lignes produites par le dernier passage dans l'étage", ["stage"])
+STAGE_MEMORY = Histogram("dashboard_stage_memory_delta_bytes", "Variation de la mémoire résidente pendant l'étage",
+                         ["stage"], buckets=(0, 1e6, 1e7, 5e7, 1e8, 2.5e8, 5e8, 1e9))
+STAGE_ERRORS = Counter("dashboard_stage_errors_total", "Étages interrompus par une exception", ["stage"])
+RUNS = Counter("dashboard_runs_total", "Relances du script", ["app"])
+PREFETCH_JOBS = Counter("dashboard_prefetch_jobs_total", "Tâches de préparation en arrière-plan, par issue", ["status"])
+
+_server = {"started": False}
+_lock = threading.Lock()
+# Profil de la relance en cours : Streamlit exécute chaque session dans son propre thread
+_current = threading.local()
+
+
+# Mémoire résidente du processus (Linux) ; None si indisponible
+def rss_bytes():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+# Endpoint /metrics démarré une seule fois par processus (toutes les sessions le partagent)
+def start_metrics_server(port=METRICS_PORT):
+    with _lock:
+        if _server["started"] or not port:
+            return
+        _server["started"] = True
+        try:
+            start_http_server(port)
+        except OSError as e:
+            # Port déjà pris (autre tableau de bord sur la même machine) : métriques non exposées ici
+            print(f"Endpoint Prometheus indisponible sur le port {port} : {e}")
+
+
+# Début d'une relance : les étages suivants sont enregistrés dans un nouveau profil
+def begin_run(app):
+    RUNS.labels(app).inc()
+    _current.stages = []
+    _current.started = time.perf_counter()
+    return _current.stages
+
+
+def current_profile():
+    return getattr(_current, "stages", [])
+
+
+# Mesure d'un étage : durée, lignes (à renseigner dans record["rows"]) et variation de mémoire
+@contextmanager
+def stage(name):
+    record = {"stage": name, "rows": None}
+    rss = rss_bytes()
+    started = time.perf_counter()
+    try:
+        yield record
+    except Exception:
+        STAGE_ERRORS.labels(name).inc()
+        raise
+    finally:
+        record["seconds"] = time.perf_counter() - started
+        STAGE_SECONDS.labels(name).observe(record["seconds"])
+        after = rss_bytes()
+        record["memory_delta"] = None if rss is None or after is None else after - rss
+        if record["memory_delta"] is not None:
+            STAGE_MEMORY.labels(name).observe(max(record["memory_delta"], 0))
+        if record["rows"] is not None:
+            STAGE_ROWS.labels(name).set(record["rows"])
+        if hasattr(_current, "stages"):
+            _current.stages.append(record)
+
+
+# Durée totale de la relance en cours
+def run_seconds():
+    return time.perf_counter() - getattr(_current, "started", time.perf_counter())
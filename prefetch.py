@@ -0,0 +1,64 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from metrics import PREFETCH_JOBS
+
+# Threads de préparation partagés par toutes les sessions (carte, graphiques, exports en arrière-plan)
+PREFETCH_WORKERS = int(os.environ.get("PREFETCH_WORKERS", str(min(4, os.cpu_count() or 1))))
+# Sélections voisines préparées par relance (ex. une par commune du résultat)
+PREFETCH_NEIGHBOURS = int(os.environ.get("PREFETCH_NEIGHBOURS", "8"))
+
+_pool = ThreadPoolExecutor(max_workers=max(1, PREFETCH_WORKERS), thread_name_prefix="prefetch")
+_lock = threading.Lock()
+# Session -> lot de tâches de sa dernière sélection
+_batches = {}
+
+
+# Tâches lancées pour une sélection d'une session. Annuler le lot retire les tâches encore en file et prévient
+# les tâches en cours par le jeton `cancelled`, qu'elles consultent entre deux étages : un étage commencé va
+# à son terme (son résultat reste dans le cache des étages).
+class Batch:
+    def __init__(self, generation):
+        self.generation = generation
+        self.cancelled = threading.Event()
+        self.futures = []
+
+    def cancel(self):
+        self.cancelled.set()
+        for future in self.futures:
+            if future.cancel():
+                PREFETCH_JOBS.labels("cancelled").inc()
+
+    def done(self):
+        return all(future.done() for future in self.futures)
+
+
+def _run(task, cancelled):
+    if cancelled.is_set():
+        PREFETCH_JOBS.labels("cancelled").inc()
+        return
+    try:
+        task(cancelled)
+    except Exception as e:
+        PREFETCH_JOBS.labels("failed").inc()
+        print(f"Préparation en arrière-plan interrompue : {e}")
+        return
+    PREFETCH_JOBS.labels("cancelled" if cancelled.is_set() else "done").inc()
+
+
+# Lance les tâches (fonctions de `cancelled`) de la sélection `generation` d'une session, dans l'ordre de
+# priorité ; le lot précédent de la session est annulé. Une relance sur la même sélection ne relance rien.
+def schedule(session, generation, tasks):
+    with _lock:
+        batch = _batches.get(session)
+        if batch is not None and batch.generation == generation:
+            return batch
+        if batch is not None:
+            batch.cancel()
+        # Sessions terminées : on oublie les lots dont toutes les tâches sont finies
+        for other in [s for s, b in _batches.items() if s != session and b.done()]:
+            del _batches[other]
+        batch = _batches[session] = Batch(generation)
+        batch.futures = [_pool.submit(_run, task, batch.cancelled) for task in tasks]
+        return batch
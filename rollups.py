@@ -0,0 +1,69 @@
+import numpy as np
+import pandas as pd
+
+from materialize import PDV_KEY, PRODUCT, QUANTITY, TOTAL_PRICE
+
+AGENT = "Nom et prénom de l'agent"
+COMMUNE = "Commune"
+DAY = "jour"
+
+# Dimensions et mesures additives du cube journalier
+DIMENSIONS = [DAY, AGENT, COMMUNE, PRODUCT]
+QTY_SUM, QTY_COUNT = "quantite_somme", "quantite_nombre"
+PRICE_SUM, PRICE_COUNT = "prix_somme", "prix_nombre"
+LINES = "lignes"
+MEASURES = [QTY_SUM, QTY_COUNT, PRICE_SUM, PRICE_COUNT, LINES]
+QTY_MEAN, PRICE_MEAN = "quantite_moyenne", "prix_moyen"
+
+# Granularités proposées : libellé -> fréquence pandas
+FREQUENCIES = {"Jour": "D", "Semaine": "W", "Mois": "M"}
+
+
+# Contributions au cube des lignes de vente (limitées aux PDV de keys si fourni)
+def cube_contributions(pdv, facts, keys=None):
+    if keys is not None:
+        facts = facts[facts[PDV_KEY].isin(keys)]
+    lines = facts[[PDV_KEY, PRODUCT, QUANTITY, TOTAL_PRICE]].merge(
+        pdv[[PDV_KEY, "_submission_time", AGENT, COMMUNE]], on=PDV_KEY, how="inner")
+    lines[DAY] = lines["_submission_time"].dt.floor("D")
+    lines[QTY_SUM] = lines[QUANTITY]
+    lines[QTY_COUNT] = lines[QUANTITY].notna().astype(np.int64)
+    lines[PRICE_SUM] = lines[TOTAL_PRICE]
+    lines[PRICE_COUNT] = lines[TOTAL_PRICE].notna().astype(np.int64)
+    lines[LINES] = 1
+    return lines.groupby(DIMENSIONS, dropna=False, sort=False)[MEASURES].sum().reset_index()
+
+
+def _compact(cube):
+    cube = cube.groupby(DIMENSIONS, dropna=False, sort=False)[MEASURES].sum().reset_index()
+    cube = cube[cube[LINES] != 0]
+    return cube.sort_values(DAY, kind="stable", ignore_index=True)
+
+
+def build_cube(pdv, facts):
+    return _compact(cube_contributions(pdv, facts))
+
+
+# Mise à jour incrémentale : les mesures étant additives, on retire les contributions des PDV modifiés
+# (anciennes tables) et on ajoute leurs nouvelles contributions, sans repasser sur les autres lignes.
+def update_cube(cube, old_pdv, old_facts, pdv, facts, keys):
+    removed = cube_contributions(old_pdv, old_facts, keys)
+    removed[MEASURES] = -removed[MEASURES]
+    return _compact(pd.concat([cube, removed, cube_contributions(pdv, facts, keys)], ignore_index=True))
+
+
+# Requête sur le cube : plage de dates, filtres sur les dimensions, regroupement par période et par axes.
+# Renvoie sommes, nombres et moyennes de quantité et de prix.
+def rollup(cube, freq="D", by=(), start=None, end=None, filters=None):
+    lo = 0 if start is None else np.searchsorted(cube[DAY].to_numpy(), np.datetime64(start, "ns"), side="left")
+    hi = len(cube) if end is None else np.searchsorted(cube[DAY].to_numpy(), np.datetime64(end, "ns"), side="right")
+    cube = cube.iloc[lo:hi]
+    for col, selection in (filters or {}).items():
+        if selection and col in DIMENSIONS:
+            cube = cube[cube[col].isin(selection)]
+
+    period = cube[DAY].dt.to_period(freq).dt.start_time.rename("periode")
+    result = cube.groupby([period] + [cube[col] for col in by], sort=True)[MEASURES].sum().reset_index()
+    result[QTY_MEAN] = result[QTY_SUM] / result[QTY_COUNT].replace(0, np.nan)
+    result[PRICE_MEAN] = result[PRICE_SUM] / result[PRICE_COUNT].replace(0, np.nan)
+    return result
@@ -0,0 +1,90 @@
+from xml.sax.saxutils import escape
+
+import numpy as np
+
+from dedup import NAME, haversine_m
+from materialize import LAT, LON, with_coordinates
+
+ORDER = "ordre"
+LEG_KM = "distance_km"
+TOTAL_KM = "cumul_km"
+# Nombre maximal de passes d'amélioration 2-opt (chaque passe est en O(n²), vectorisée par ligne)
+MAX_PASSES = 50
+
+
+# Distances à vol d'oiseau (mètres) entre tous les points, calculées une fois par tournée
+def distance_matrix(lat, lon):
+    return haversine_m(lat[:, None], lon[:, None], lat[None, :], lon[None, :])
+
+
+# Ordre glouton : depuis le départ (0), toujours le point non visité le plus proche ; l'arrivée (n-1) reste en dernier
+def nearest_neighbour(dist):
+    n = len(dist)
+    visited = np.zeros(n, dtype=bool)
+    visited[[0, n - 1]] = True
+    order = [0]
+    for _ in range(n - 2):
+        row = np.where(visited, np.inf, dist[order[-1]])
+        order.append(int(row.argmin()))
+        visited[order[-1]] = True
+    return np.array(order + [n - 1])
+
+
+# Amélioration 2-opt à extrémités fixes : pour chaque arête (i, i+1), toutes les arêtes (j, j+1) sont évaluées
+# d'un coup ; le meilleur retournement du segment i+1..j est appliqué, jusqu'à ce qu'aucun ne raccourcisse la tournée
+def two_opt(order, dist, max_passes=MAX_PASSES):
+    order = order.copy()
+    n = len(order)
+    for _ in range(max_passes):
+        improved = False
+        for i in range(n - 3):
+            a, b = order[i], order[i + 1]
+            c, d = order[i + 2:n - 1], order[i + 3:n]
+            delta = dist[a, c] + dist[b, d] - dist[a, b] - dist[c, d]
+            k = int(delta.argmin())
+            if delta[k] < -1e-6:
+                order[i + 1:i + 3 + k] = order[i + 1:i + 3 + k][::-1]
+                improved = True
+        if not improved:
+            break
+    return order
+
+
+# Tournée d'un agent : ordre de visite des points de vente (avec coordonnées) depuis un point de départ.
+# Sans retour, l'arrivée est un point fictif à distance nulle de tous les autres : la tournée finit où elle veut.
+# Renvoie les points dans l'ordre (numéro de passage, distance de chaque étape et cumul, en km) et la longueur
+# totale, retour compris.
+def plan_route(stops, start_lat, start_lon, return_to_start=False):
+    stops = with_coordinates(stops)
+    lat = np.r_[start_lat, stops[LAT].to_numpy(float), start_lat]
+    lon = np.r_[start_lon, stops[LON].to_numpy(float), start_lon]
+    dist = distance_matrix(lat, lon)
+    if not return_to_start:
+        dist[-1, :] = dist[:, -1] = 0
+    order = two_opt(nearest_neighbour(dist), dist)
+    legs = dist[order[:-1], order[1:]] / 1000
+    route = stops.iloc[order[1:-1] - 1].copy()
+    route.insert(0, ORDER, np.arange(1, len(route) + 1))
+    route[LEG_KM] = legs[:len(route)].round(3)
+    route[TOTAL_KM] = legs[:len(route)].cumsum().round(3)
+    return route.reset_index(drop=True), float(legs.sum())
+
+
+# Export GPX (trace + points de passage), lisible hors ligne par les applications de navigation
+def route_gpx(route, start_lat, start_lon, name, return_to_start=False):
+    points = [(start_lat, start_lon, "Départ")]
+    points += [(row[LAT], row[LON], f"{row[ORDER]}. {row.get(NAME, '')}") for _, row in route.iterrows()]
+    if return_to_start:
+        points.append((start_lat, start_lon, "Retour"))
+    waypoints = "".join(f'<wpt lat="{lat}" lon="{lon}"><name>{escape(str(label))}</name></wpt>'
+                        for lat, lon, label in points)
+    track = "".join(f'<trkpt lat="{lat}" lon="{lon}"/>' for lat, lon, _ in points)
+    return ('<?xml version="1.0" encoding="UTF-8"?>'
+            '<gpx version="1.1" creator="Unilever dashboard" xmlns="http://www.topografix.com/GPX/1/1">'
+            f'{waypoints}<trk><name>{escape(name)}</name><trkseg>{track}</trkseg></trk></gpx>').encode("utf-8")
+
+
+# Tableau exporté : ordre de passage, point de vente, coordonnées et distances
+def route_table(route, columns):
+    return route[[ORDER] + [c for c in columns if c in route.columns] + [LAT, LON, LEG_KM, TOTAL_KM]]
+
@@ -0,0 +1,99 @@
+from bisect import bisect_right
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+from ingestion import data_version, load_lines
+
+# Séparateur des valeurs dans le texte concaténé d'une colonne (absent des saisies)
+SEP = "\x00"
+
+# Modes de recherche proposés dans l'explorateur
+SEARCH_MODES = {"Contient": "contains", "Commence par": "prefix", "Égal à": "exact"}
+ALL_TEXT_COLUMNS = "(Toutes les colonnes texte)"
+
+
+# Texte d'une colonne concaténé en une seule chaîne "\0v1\0v2\0...\0" + position de début de chaque valeur.
+# Une recherche sélective est une suite de str.find (code C) qui saute à la ligne suivante à chaque résultat ;
+# une recherche qui touche beaucoup de lignes parcourt directement le tableau des valeurs. Jamais de regex.
+class TextColumn:
+    def __init__(self, values):
+        self.values = np.array(values, dtype=object)
+        self.blob = SEP + SEP.join(values) + SEP
+        self.starts = np.cumsum([1] + [len(v) + 1 for v in values[:-1]]).tolist() if values else []
+
+    def __len__(self):
+        return len(self.starts)
+
+    def _scan(self, needle, mode):
+        if mode == "exact":
+            return self.values == needle
+        if mode == "prefix":
+            return np.fromiter((v.startswith(needle) for v in self.values), dtype=bool, count=len(self))
+        return np.fromiter((needle in v for v in self.values), dtype=bool, count=len(self))
+
+    def find(self, needle, mode="contains"):
+        if not needle and mode != "exact":
+            return np.ones(len(self), dtype=bool)
+        if mode == "exact":
+            return self._scan(needle, mode)
+        pattern = SEP + needle if mode == "prefix" else needle
+        if self.blob.count(pattern) > len(self) // 8:
+            return self._scan(needle, mode)
+
+        mask = np.zeros(len(self), dtype=bool)
+        # Le motif prefix commence sur le séparateur qui précède la valeur
+        shift = 1 if mode == "prefix" else 0
+        pos = self.blob.find(pattern)
+        while pos != -1:
+            row = bisect_right(self.starts, pos + shift) - 1
+            mask[row] = True
+            if row + 1 >= len(self):
+                break
+            # Une ligne trouvée suffit : reprise au début de la valeur suivante
+            pos = self.blob.find(pattern, self.starts[row + 1] - 1)
+        return mask
+
+
+# Index de recherche de la vue au grain ligne de vente, construit colonne par colonne à la première recherche
+class SearchIndex:
+    def __init__(self, df):
+        self.df = df
+        self.text_columns = [c for c in df.columns
+                             if df[c].dtype == object or isinstance(df[c].dtype, pd.CategoricalDtype)]
+        self._columns = {}
+
+    def column(self, col, ignore_case):
+        key = (col, ignore_case)
+        if key not in self._columns:
+            s = self.df[col]
+            if pd.api.types.is_datetime64_any_dtype(s):
+                s = s.dt.strftime("%Y-%m-%d %H:%M:%S")
+            values = s.astype(object).astype(str).where(s.notna(), "").str.replace(SEP, " ", regex=False)
+            if ignore_case:
+                values = values.str.casefold()
+            self._columns[key] = TextColumn(values.tolist())
+        return self._columns[key]
+
+    # Masque (sur toutes les lignes de la vue) des valeurs qui correspondent à la recherche
+    def search(self, value, column=ALL_TEXT_COLUMNS, mode="contains", ignore_case=True):
+        value = value.replace(SEP, " ")
+        if ignore_case:
+            value = value.casefold()
+        columns = self.text_columns if column == ALL_TEXT_COLUMNS else [column]
+        mask = np.zeros(len(self.df), dtype=bool)
+        for col in columns:
+            mask |= self.column(col, ignore_case).find(value, mode)
+        return mask
+
+
+@lru_cache(maxsize=4)
+def _load_search_index(version, pdv_columns, fact_columns):
+    return SearchIndex(load_lines(pdv_columns, fact_columns, version))
+
+
+# Index de recherche partagé entre les sessions ; les DataFrames filtrés gardent les étiquettes
+# de ligne de la vue complète, ce qui permet d'appliquer le masque par .index (même version que la sélection)
+def load_search_index(pdv_columns, fact_columns, version=None):
+    return _load_search_index(data_version() if version is None else version, tuple(pdv_columns), tuple(fact_columns))
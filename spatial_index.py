@@ -0,0 +1,119 @@
+from functools import lru_cache
+
+import numpy as np
+
+from ingestion import data_version, load_tables
+from materialize import LAT, LON, with_coordinates
+
+PDV_KEY = "_index"
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = np.pi * EARTH_RADIUS_KM / 180
+
+# Décalage des indices de cellule pour obtenir des clés positives sur 16 bits
+_CELL_OFFSET = 1 << 15
+
+
+# Distance haversine (km) entre un point et des tableaux de coordonnées
+def haversine_km(lat, lon, lats, lons):
+    lat, lon, lats, lons = map(np.radians, (lat, lon, lats, lons))
+    a = np.sin((lats - lat) / 2) ** 2 + np.cos(lat) * np.cos(lats) * np.sin((lons - lon) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(a))
+
+
+# Index spatial en grille régulière sur les coordonnées des points de vente.
+# Les points sont triés par cellule (ligne de latitude, puis longitude) : une boîte englobante
+# se résout en une tranche contiguë par ligne de cellules, puis un test exact sur les candidats.
+class SpatialIndex:
+    def __init__(self, df, cell_size=0.01):
+        points = with_coordinates(df)
+        self.cell_size = cell_size
+        lats = points[LAT].to_numpy(dtype=np.float64)
+        lons = points[LON].to_numpy(dtype=np.float64)
+        cells = self._cell_keys(self._cell(lats), self._cell(lons))
+        order = np.argsort(cells, kind="stable")
+        self.cells = cells[order]
+        self.lats = lats[order]
+        self.lons = lons[order]
+        self.keys = points[PDV_KEY].to_numpy()[order]
+
+    def __len__(self):
+        return len(self.keys)
+
+    def _cell(self, degrees):
+        return np.floor(np.asarray(degrees) / self.cell_size).astype(np.int64)
+
+    @staticmethod
+    def _cell_keys(rows, cols):
+        return ((rows + _CELL_OFFSET) << 16) | (cols + _CELL_OFFSET)
+
+    # Positions des points de la boîte [min_lat, max_lat] x [min_lon, max_lon]
+    def _bbox_positions(self, min_lat, min_lon, max_lat, max_lon):
+        rows = np.arange(self._cell(min_lat), self._cell(max_lat) + 1)
+        col_min, col_max = self._cell(min_lon), self._cell(max_lon)
+        starts = np.searchsorted(self.cells, self._cell_keys(rows, col_min), side="left")
+        ends = np.searchsorted(self.cells, self._cell_keys(rows, col_max), side="right")
+        slices = [np.arange(s, e) for s, e in zip(starts, ends) if e > s]
+        if not slices:
+            return np.empty(0, dtype=np.int64)
+        candidates = np.concatenate(slices)
+        inside = ((self.lats[candidates] >= min_lat) & (self.lats[candidates] <= max_lat) &
+                  (self.lons[candidates] >= min_lon) & (self.lons[candidates] <= max_lon))
+        return candidates[inside]
+
+    def bbox(self, min_lat, min_lon, max_lat, max_lon):
+        return self.keys[self._bbox_positions(min_lat, min_lon, max_lat, max_lon)]
+
+    # Points de vente à moins de radius_km du point (lat, lon)
+    def radius(self, lat, lon, radius_km):
+        dlat = radius_km / KM_PER_DEGREE
+        dlon = dlat / max(np.cos(np.radians(lat)), 1e-6)
+        candidates = self._bbox_positions(lat - dlat, lon - dlon, lat + dlat, lon + dlon)
+        distances = haversine_km(lat, lon, self.lats[candidates], self.lons[candidates])
+        return self.keys[candidates[distances <= radius_km]]
+
+    # Points de vente dans un polygone GeoJSON ([[lon, lat], ...], premier anneau uniquement)
+    def polygon(self, ring):
+        ring = np.asarray(ring, dtype=np.float64)
+        xs, ys = ring[:, 0], ring[:, 1]
+        candidates = self._bbox_positions(ys.min(), xs.min(), ys.max(), xs.max())
+        px, py = self.lons[candidates], self.lats[candidates]
+        inside = np.zeros(len(candidates), dtype=bool)
+        # Lancer de rayon, vectorisé sur les candidats, une itération par arête
+        for x1, y1, x2, y2 in zip(xs, ys, np.roll(xs, -1), np.roll(ys, -1)):
+            crosses = (y1 > py) != (y2 > py)
+            with np.errstate(divide="ignore", invalid="ignore"):
+                x_cross = (x2 - x1) * (py - y1) / (y2 - y1) + x1
+            inside ^= crosses & (px < x_cross)
+        return self.keys[candidates[inside]]
+
+    # Union des points de vente couverts par des formes GeoJSON dessinées (Draw) :
+    # polygones / rectangles, et cercles exportés en Point avec properties.radius (mètres)
+    def query_features(self, features):
+        found = [np.empty(0, dtype=self.keys.dtype)]
+        for feature in features or []:
+            geometry = feature.get("geometry") or {}
+            kind, coords = geometry.get("type"), geometry.get("coordinates")
+            if kind == "Polygon":
+                found.append(self.polygon(coords[0]))
+            elif kind == "MultiPolygon":
+                found.extend(self.polygon(poly[0]) for poly in coords)
+            elif kind == "Point" and (feature.get("properties") or {}).get("radius"):
+                found.append(self.radius(coords[1], coords[0], feature["properties"]["radius"] / 1000))
+        return np.unique(np.concatenate(found))
+
+
+# Cercle au format des formes dessinées, pour les recherches « à moins de N km de ce point »
+def circle_feature(lat, lon, radius_km):
+    return {"type": "Feature", "properties": {"radius": radius_km * 1000},
+            "geometry": {"type": "Point", "coordinates": [lon, lat]}}
+
+
+@lru_cache(maxsize=2)
+def _load_spatial_index(version):
+    pdv, _ = load_tables(version)
+    return SpatialIndex(pdv)
+
+
+# Index spatial des points de vente de la version courante, partagé entre les sessions
+def load_spatial_index(version=None):
+    return _load_spatial_index(data_version() if version is None else version)
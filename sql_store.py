@@ -0,0 +1,225 @@
+import json
+import os
+import sqlite3
+from contextlib import closing
+
+import pandas as pd
+
+from data_loader import DATETIME_COLUMNS
+from materialize import PARENT_KEY, PDV_KEY, PRODUCT
+
+# Base SQLite à côté des tables Parquet du stockage (dérivée, reconstruite depuis les exports)
+DB_PATH = os.environ.get("KOBO_DB_PATH", os.path.join(os.environ.get("KOBO_STORE_DIR", ".kobo_store"), "kobo.sqlite"))
+
+AGENT = "Nom et prénom de l'agent"
+COMMUNE = "Commune"
+SUBMISSION_TIME = "_submission_time"
+# Format texte des dates : l'ordre alphabétique est l'ordre chronologique (requêtes par plage indexées)
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+CHUNK_ROWS = 10_000
+
+# Index de chaque table : clés des remplacements incrémentaux, colonnes filtrées, jointes ou listées en options
+INDEXES = {
+    "pdv": [SUBMISSION_TIME, COMMUNE, AGENT],
+    "facts": [PDV_KEY, PRODUCT],
+    "gpi": [PARENT_KEY],
+    "sales": ["OrderDate", "Region", "City", "Product"],
+}
+# Clé primaire de chaque table (rowid implicite sinon)
+PRIMARY_KEYS = {"pdv": PDV_KEY, "gpi": PDV_KEY}
+# Colonnes internes du stockage Parquet, non reprises en SQL
+SKIP_COLUMNS = {"_row_hash"}
+
+
+def quote(name):
+    return '"' + str(name).replace('"', '""') + '"'
+
+
+# Connexion en mode WAL : les lectures des tableaux de bord ne bloquent pas l'intégration en cours
+def connect(path=None):
+    path = path or DB_PATH
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    conn = sqlite3.connect(path, timeout=30)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+
+def _sql_type(dtype):
+    if pd.api.types.is_bool_dtype(dtype) or pd.api.types.is_integer_dtype(dtype):
+        return "INTEGER"
+    if pd.api.types.is_float_dtype(dtype):
+        return "REAL"
+    return "TEXT"
+
+
+def table_columns(conn, table):
+    return [row[1] for row in conn.execute(f"PRAGMA table_info({quote(table)})")]
+
+
+def create_table(conn, table, df):
+    columns = [c for c in df.columns if c not in SKIP_COLUMNS]
+    definitions = []
+    for col in columns:
+        definition = f"{quote(col)} {_sql_type(df[col].dtype)}"
+        if PRIMARY_KEYS.get(table) == col:
+            definition += " PRIMARY KEY"
+        definitions.append(definition)
+    conn.execute(f"DROP TABLE IF EXISTS {quote(table)}")
+    conn.execute(f"CREATE TABLE {quote(table)} ({', '.join(definitions)})")
+    create_indexes(conn, table, columns)
+
+
+# Index manquants créés aussi lors d'une mise à jour incrémentale (base créée par une version antérieure)
+def create_indexes(conn, table, columns):
+    for col in INDEXES.get(table, []):
+        if col in columns and PRIMARY_KEYS.get(table) != col:
+            conn.execute(f"CREATE INDEX IF NOT EXISTS {quote(f'{table}_{col}')} ON {quote(table)} ({quote(col)})")
+
+
+# Lignes prêtes pour executemany : dates en texte triable, valeurs manquantes en NULL
+def _records(df, columns, chunk_rows=CHUNK_ROWS):
+    for start in range(0, len(df), chunk_rows):
+        chunk = df.iloc[start:start + chunk_rows][columns].copy()
+        for col in columns:
+            if pd.api.types.is_datetime64_any_dtype(chunk[col]):
+                chunk[col] = chunk[col].dt.strftime(TIME_FORMAT)
+        chunk = chunk.astype(object)
+        yield from chunk.where(chunk.notna(), None).itertuples(index=False, name=None)
+
+
+def insert_rows(conn, table, df):
+    columns = [c for c in table_columns(conn, table) if c in df.columns]
+    placeholders = ", ".join("?" for _ in columns)
+    conn.executemany(f"INSERT INTO {quote(table)} ({', '.join(map(quote, columns))}) VALUES ({placeholders})",
+                     _records(df, columns))
+
+
+# Recopie des tables matérialisées dans la base. Avec keys, seuls les PDV touchés sont remplacés
+# (leurs lignes de vente et de GPI comprises) ; sinon, ou si le schéma a changé, tout est reconstruit.
+def sync_tables(tables, keys=None):
+    with closing(connect()) as conn, conn:
+        for table, df in tables.items():
+            key = PARENT_KEY if table == "gpi" else PDV_KEY
+            expected = [c for c in df.columns if c not in SKIP_COLUMNS]
+            if keys is None or table_columns(conn, table) != expected:
+                create_table(conn, table, df)
+                insert_rows(conn, table, df)
+                continue
+            create_indexes(conn, table, expected)
+            selected = json.dumps([int(k) for k in keys])
+            conn.execute(f"DELETE FROM {quote(table)} WHERE {quote(key)} IN (SELECT value FROM json_each(?))", (selected,))
+            insert_rows(conn, table, df[df[key].isin(keys)])
+
+
+# Clause WHERE poussée dans SQLite : plage de dates, listes de valeurs, PDV retenus (zone géographique)
+def _where(conn, start=None, end=None, filters=None, keys=None):
+    pdv_columns = set(table_columns(conn, "pdv"))
+    clauses, params = [], []
+    if start is not None:
+        clauses.append(f"p.{quote(SUBMISSION_TIME)} >= ?")
+        params.append(pd.Timestamp(start).strftime(TIME_FORMAT))
+    if end is not None:
+        clauses.append(f"p.{quote(SUBMISSION_TIME)} <= ?")
+        params.append(pd.Timestamp(end).strftime(TIME_FORMAT))
+    for col, selection in (filters or {}).items():
+        if selection:
+            alias = "p" if col in pdv_columns else "f"
+            clauses.append(f"{alias}.{quote(col)} IN (SELECT value FROM json_each(?))")
+            params.append(json.dumps(list(selection), ensure_ascii=False))
+    if keys is not None:
+        clauses.append(f"p.{quote(PDV_KEY)} IN (SELECT value FROM json_each(?))")
+        params.append(json.dumps([int(k) for k in keys]))
+    return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+
+def _select(conn, columns):
+    pdv_columns = set(table_columns(conn, "pdv"))
+    return ", ".join(f"{'p' if col in pdv_columns else 'f'}.{quote(col)}" for col in columns)
+
+
+def _frame(rows, columns):
+    df = pd.DataFrame.from_records(rows, columns=columns)
+    for col in columns:
+        if col in DATETIME_COLUMNS:
+            df[col] = pd.to_datetime(df[col], format=TIME_FORMAT, errors="coerce")
+    return df
+
+
+LINES_FROM = f" FROM pdv p LEFT JOIN facts f ON f.{quote(PDV_KEY)} = p.{quote(PDV_KEY)}"
+
+
+# Nombre de lignes de vente (un PDV sans vente compte pour une ligne) correspondant aux filtres
+def count_lines(start=None, end=None, filters=None, keys=None):
+    with closing(connect()) as conn:
+        where, params = _where(conn, start, end, filters, keys)
+        count = conn.execute("SELECT COUNT(*)" + LINES_FROM + where, params).fetchone()[0]
+    return count
+
+
+# Une page de la vue au grain ligne de vente : projection, filtres, tri et pagination faits par SQLite
+def query_lines(columns, start=None, end=None, filters=None, keys=None,
+                order_by=None, descending=False, limit=None, offset=0):
+    columns = list(dict.fromkeys(columns))
+    with closing(connect()) as conn:
+        where, params = _where(conn, start, end, filters, keys)
+        order = f"p.{quote(PDV_KEY)}, f.rowid"
+        if order_by is not None:
+            alias = "p" if order_by in table_columns(conn, "pdv") else "f"
+            column = f"{alias}.{quote(order_by)}"
+            # Valeurs manquantes en dernier, dans les deux sens (comme le tri du tableau en mémoire)
+            order = f"{column} IS NULL, {column} {'DESC' if descending else 'ASC'}, " + order
+        sql = f"SELECT {_select(conn, columns)}" + LINES_FROM + where + f" ORDER BY {order}"
+        if limit is not None:
+            sql += " LIMIT ? OFFSET ?"
+            params += [int(limit), int(offset)]
+        rows = conn.execute(sql, params).fetchall()
+    return _frame(rows, columns)
+
+
+# Lecture d'une table par blocs de chunk_rows lignes, limitée aux PDV de keys si fourni
+def iter_table(table, keys=None, chunk_rows=CHUNK_ROWS):
+    key = PARENT_KEY if table == "gpi" else PDV_KEY
+    with closing(connect()) as conn:
+        columns = table_columns(conn, table)
+        sql, params = f"SELECT * FROM {quote(table)}", []
+        if keys is not None:
+            sql += f" WHERE {quote(key)} IN (SELECT value FROM json_each(?))"
+            params.append(json.dumps([int(k) for k in keys]))
+        cursor = conn.execute(sql + " ORDER BY rowid", params)
+        rows = cursor.fetchmany(chunk_rows)
+        # Au moins un bloc, éventuellement vide, pour que l'appelant connaisse les colonnes
+        yield _frame(rows, columns)
+        while rows:
+            rows = cursor.fetchmany(chunk_rows)
+            if rows:
+                yield _frame(rows, columns)
+
+
+# Ajout d'un enregistrement (transaction SQLite : les écritures concurrentes sont sérialisées, aucune perdue)
+def insert_record(table, record, path=None):
+    columns = list(record)
+    placeholders = ", ".join("?" for _ in columns)
+    with closing(connect(path)) as conn, conn:
+        cursor = conn.execute(f"INSERT INTO {quote(table)} ({', '.join(map(quote, columns))}) VALUES ({placeholders})",
+                              [record[col] for col in columns])
+    return cursor.lastrowid
+
+
+def has_table(table, path=None):
+    with closing(connect(path)) as conn:
+        return bool(table_columns(conn, table))
+
+
+# Dernier rowid de la table : change à chaque ajout, sert de signature bon marché
+def last_rowid(table, path=None):
+    with closing(connect(path)) as conn:
+        return conn.execute(f"SELECT MAX(rowid) FROM {quote(table)}").fetchone()[0] or 0
+
+
+# Valeurs distinctes d'une colonne (ordre de première apparition), lues dans l'index de la colonne
+def distinct_values(table, column, path=None):
+    with closing(connect(path)) as conn:
+        rows = conn.execute(f"SELECT {quote(column)} FROM {quote(table)} WHERE {quote(column)} IS NOT NULL "
+                            f"GROUP BY {quote(column)} ORDER BY MIN(rowid)").fetchall()
+    return [row[0] for row in rows]
@@ -0,0 +1,143 @@
+import hashlib
+import os
+import sys
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from ingestion import data_version
+
+# Budget mémoire commun à tous les étages (Mo), partagé par toutes les sessions du processus
+STAGE_CACHE_MB = int(os.environ.get("STAGE_CACHE_MB", "512"))
+
+
+# Taille approximative d'un résultat ; les colonnes texte sont estimées sur un échantillon
+def estimate_bytes(value):
+    if isinstance(value, pd.DataFrame):
+        size = int(value.memory_usage(index=True, deep=False).sum())
+        for col in value.columns[value.dtypes == object]:
+            sample = value[col].iloc[:100]
+            if len(sample):
+                size += int(sum(sys.getsizeof(v) for v in sample) / len(sample) * len(value))
+        return size
+    if isinstance(value, (bytes, bytearray, str)):
+        return len(value)
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, dict):
+        return sum(estimate_bytes(v) for v in value.values()) + sys.getsizeof(value)
+    if isinstance(value, (list, tuple)):
+        sample = value[:100]
+        per_item = sum(estimate_bytes(v) for v in sample) / len(sample) if sample else 0
+        return int(per_item * len(value)) + sys.getsizeof(value)
+    # Carte folium (élément branca) : l'objet est minuscule, les données sont portées par ses couches
+    # (marqueurs, points de la heatmap, formes) ; on parcourt l'arbre des éléments
+    if hasattr(value, "_children"):
+        data = getattr(value, "data", None)
+        size = sys.getsizeof(value) + (0 if data is None else estimate_bytes(data))
+        return size + sum(estimate_bytes(child) for child in value._children.values())
+    return sys.getsizeof(value)
+
+
+# Calcul en cours d'une clé : les autres demandeurs (session, tâche de préparation) attendent son résultat
+class _Pending:
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+# Cache LRU borné en octets, partagé entre les sessions et les relances.
+# Les valeurs sont partagées : elles ne doivent jamais être modifiées en place par l'appelant.
+class StageCache:
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.waits = 0
+        self._entries = OrderedDict()
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def __contains__(self, full_key):
+        with self._lock:
+            return full_key in self._entries or full_key in self._pending
+
+    def get_or_compute(self, stage, key, compute):
+        full_key = (stage, key)
+        with self._lock:
+            if full_key in self._entries:
+                self._entries.move_to_end(full_key)
+                self.hits += 1
+                return self._entries[full_key][0]
+            pending = self._pending.get(full_key)
+            owner = pending is None
+            if owner:
+                pending = self._pending[full_key] = _Pending()
+                self.misses += 1
+            else:
+                self.waits += 1
+
+        # Clé déjà en calcul (autre session ou préparation en arrière-plan) : on attend son résultat
+        if not owner:
+            pending.done.wait()
+            if pending.error is not None:
+                raise pending.error
+            return pending.value
+
+        # Calcul hors verrou, une seule fois par clé
+        try:
+            pending.value = compute()
+        except BaseException as e:
+            pending.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._pending[full_key]
+                if pending.error is None:
+                    self._store(full_key, pending.value)
+            pending.done.set()
+        return pending.value
+
+    # Appelé sous verrou
+    def _store(self, full_key, value):
+        size = estimate_bytes(value)
+        if full_key in self._entries:
+            self.total_bytes -= self._entries.pop(full_key)[1]
+        if size <= self.max_bytes:
+            self._entries[full_key] = (value, size)
+            self.total_bytes += size
+            while self.total_bytes > self.max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self.total_bytes -= evicted
+
+    def stats(self):
+        with self._lock:
+            stages = {}
+            for (stage, _), (_, size) in self._entries.items():
+                count, total = stages.get(stage, (0, 0))
+                stages[stage] = (count + 1, total + size)
+            return {"hits": self.hits, "misses": self.misses, "waits": self.waits, "bytes": self.total_bytes,
+                    "stages": stages}
+
+
+cache = StageCache(STAGE_CACHE_MB * 1024 * 1024)
+
+
+# Résultat d'un étage (data version -> jointure -> filtrage -> carte / graphiques / exports), calculé
+# une seule fois pour une même clé d'entrée
+def cached(stage, key, compute):
+    return cache.get_or_compute(stage, key, compute)
+
+
+# Identité d'une sélection : version des données, colonnes et lignes retenues. La version lue au début de la relance
+# est passée par l'appelant : une intégration terminée entre-temps ne doit pas changer la clé d'une sélection
+# filtrée sur l'ancienne version (ni celle des tâches de préchargement de cette relance).
+def frame_key(df, version=None):
+    version = data_version() if version is None else version
+    digest = hashlib.sha1(f"{version}|{list(df.columns)}".encode("utf-8"))
+    digest.update(df.index.to_numpy().tobytes())
+    return digest.hexdigest()
@@ -0,0 +1,136 @@
+import os
+import sqlite3
+from contextlib import closing
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import data_loader
+import ingestion
+import sql_store
+from benchmark import generate_sheets, write_workbook
+
+EXPORT_NAME = "Unilever_-_all_versions_-_labels_-_{}.xlsx"
+SUBMISSIONS = 200
+# Tables dérivées comparées, et leurs colonnes de tri
+TABLES = {
+    "pdv": ["_index"],
+    "facts": ["_index", "_line_index"],
+    "cube": None,
+    "visits": None,
+    "outlets": ["_outlet"],
+}
+SQL_TABLES = {"pdv": "_index", "facts": "_index, _line_index", "gpi": "_index"}
+
+
+# Sous-ensemble d'un export : soumissions retenues et leurs lignes GPI / Sondage
+def subset(sheets, keys):
+    unilever = {col: values[np.isin(sheets["Unilever"]["_index"], keys)] for col, values in sheets["Unilever"].items()}
+    children = {
+        sheet: {col: values[np.isin(sheets[sheet]["_parent_index"], keys)] for col, values in sheets[sheet].items()}
+        for sheet in ("GPI", "Sondage")
+    }
+    return {"Unilever": unilever, **children}
+
+
+# Premier export (150 soumissions) puis export complet où des soumissions ont été ajoutées, modifiées,
+# supprimées, rattachées à un autre PDV ou dédoublonnées
+def exports():
+    sheets = generate_sheets(SUBMISSIONS, seed=1)
+    first = subset(sheets, np.arange(1, 151))
+
+    latest = {sheet: {col: values.copy() for col, values in columns.items()} for sheet, columns in sheets.items()}
+    sondage, unilever = latest["Sondage"], latest["Unilever"]
+    price = sondage["Prix de vente unitaire de ${Sorte_caracteristic}"]
+    price[0] += 100
+    # Une cellule vide : la colonne des prix est relue en flottants
+    price[1] = np.nan
+    # Ligne de vente rattachée à un autre PDV
+    sondage["_parent_index"][2] = 40
+    # Nouvelle visite d'un PDV existant : même nom, même téléphone, même position
+    for col in ("Nom de l'établissement", "Numéro de téléphone", "Commune",
+                "_Prendre les coordonnées du point de vente_latitude",
+                "_Prendre les coordonnées du point de vente_longitude"):
+        unilever[col][180] = unilever[col][10]
+    unilever["Type du PDV"][5] = "Kiosque modifié"
+    # Soumission supprimée dans Kobo, et une ligne de vente retirée d'une soumission conservée
+    latest = subset(latest, np.setdiff1d(np.arange(1, SUBMISSIONS + 1), [20]))
+    kept = np.arange(len(latest["Sondage"]["_index"])) != np.flatnonzero(latest["Sondage"]["_parent_index"] == 30)[0]
+    latest["Sondage"] = {col: values[kept] for col, values in latest["Sondage"].items()}
+    return first, latest
+
+
+def ingest(directory, monkeypatch, workbooks):
+    os.makedirs(directory, exist_ok=True)
+    store_dir = os.path.join(directory, "store")
+    monkeypatch.setattr(ingestion, "DROP_DIR", str(directory))
+    monkeypatch.setattr(ingestion, "STORE_DIR", store_dir)
+    monkeypatch.setattr(ingestion, "MANIFEST", os.path.join(store_dir, "manifest.json"))
+    monkeypatch.setattr(ingestion, "CATEGORIES", os.path.join(store_dir, "categories.json"))
+    monkeypatch.setattr(sql_store, "DB_PATH", os.path.join(store_dir, "kobo.sqlite"))
+    monkeypatch.setattr(data_loader, "CACHE_DIR", os.path.join(directory, "cache"))
+    for stamp, sheets in workbooks:
+        write_workbook(sheets, os.path.join(directory, EXPORT_NAME.format(stamp)))
+        ingestion.ingest_new_exports()
+    tables = {table: ingestion.read_store_sheet(table) for table in TABLES}
+    with closing(sqlite3.connect(sql_store.DB_PATH)) as conn:
+        sql = {table: pd.read_sql_query(f"SELECT * FROM {table} ORDER BY {order}", conn)
+               for table, order in SQL_TABLES.items()}
+    return tables, sql
+
+
+def normalized(df, keys):
+    keys = keys or [c for c in df.columns if not pd.api.types.is_numeric_dtype(df[c]) or c == "jour"]
+    df = df.astype({c: "float64" for c in df.columns if pd.api.types.is_numeric_dtype(df[c])})
+    return df.sort_values(keys, ignore_index=True)[sorted(df.columns)]
+
+
+@pytest.fixture(scope="module")
+def workbooks():
+    return exports()
+
+
+def test_incremental_ingestion_matches_full_rebuild(tmp_path, monkeypatch, workbooks):
+    first, latest = workbooks
+    incremental, incremental_sql = ingest(tmp_path / "incremental", monkeypatch,
+                                          [("2024-11-01-08-00-00", first), ("2024-11-28-12-22-34", latest)])
+    full, full_sql = ingest(tmp_path / "full", monkeypatch, [("2024-11-28-12-22-34", latest)])
+
+    assert 20 not in set(incremental["pdv"]["_index"])
+    assert incremental["pdv"]["_outlet"].nunique() < len(incremental["pdv"])
+    for table, keys in TABLES.items():
+        pd.testing.assert_frame_equal(normalized(incremental[table], keys), normalized(full[table], keys),
+                                      check_categorical=False, obj=table)
+    for table in SQL_TABLES:
+        pd.testing.assert_frame_equal(incremental_sql[table].astype(object), full_sql[table].astype(object), obj=table)
+
+
+# Intégration interrompue après l'écriture d'une partie des tables dérivées : la suivante reprend l'export
+def test_interrupted_ingestion_is_resumed(tmp_path, monkeypatch, workbooks):
+    first, latest = workbooks
+    ingest(tmp_path / "resumed", monkeypatch, [("2024-11-01-08-00-00", first)])
+
+    def fail(*args, **kwargs):
+        raise OSError("base SQLite indisponible")
+
+    with monkeypatch.context() as m:
+        m.setattr(ingestion, "sync_tables", fail)
+        with pytest.raises(OSError):
+            ingest(tmp_path / "resumed", monkeypatch, [("2024-11-28-12-22-34", latest)])
+    assert ingestion.read_manifest()["interrupted"]
+    ingestion.ingest_new_exports()
+    resumed, resumed_sql = ingest(tmp_path / "resumed", monkeypatch, [])
+    full, full_sql = ingest(tmp_path / "full", monkeypatch, [("2024-11-28-12-22-34", latest)])
+
+    for table, keys in TABLES.items():
+        pd.testing.assert_frame_equal(normalized(resumed[table], keys), normalized(full[table], keys),
+                                      check_categorical=False, obj=table)
+    for table in SQL_TABLES:
+        pd.testing.assert_frame_equal(resumed_sql[table].astype(object), full_sql[table].astype(object), obj=table)
+
+
+def test_older_export_copied_later_is_ignored(tmp_path, monkeypatch, workbooks):
+    first, latest = workbooks
+    tables, _ = ingest(tmp_path, monkeypatch, [("2024-11-28-12-22-34", latest), ("2024-11-01-08-00-00", first)])
+    assert len(tables["pdv"]) == SUBMISSIONS - 1